@@ -3,9 +3,27 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import torch
 import pickle
+import os
+import sys
+import time
+import json
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+from scipy.sparse import coo_array, csr_array
+from scipy.sparse.linalg import eigsh
+from sklearn.cluster import KMeans
+try:
+    import resource
+except ImportError:
+    resource = None
 
 from utils import plot_JRX, plot_ICL
-from initialisation_methods import spectral_clustering, hierarchical_clustering, modularity_clustering, modularity_module
+from sparse_graph import SparseGraph
+from results_store import ResultsStore, Checkpoint
+from posteriors import CompactTau, tau_labels
+from initialisation_methods import spectral_clustering, hierarchical_clustering, modularity_module, \
+                                   initialisation_precomputed, tau_from_precomputed, InitialisationCache, DETERMINISTIC_METHODS, restart_params
 
 def return_priors_pi(graph_edges, tau):
     """
@@ -50,22 +68,55 @@ def return_priors_pi(graph_edges, tau):
 
     return prior, pi
 
+def return_priors_pi_sparse(graph_edges, tau, include_self_pairs = False):
+    """
+    M-step written with matrix products: the nominator is tau^T X tau and the denominator 
+    (sum tau)(sum tau)^T - tau^T tau, the mass of the pairs i != j on which J_R_x_sparse is defined,
+    so that neither the (n, n, Q, Q) theta tensor nor the dense X is needed.
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X (SparseGraph, torch sparse, scipy CSR, dense adjacency)
+        tau (torch tensor): last estimation of the tau of size (n_vertices, n_cluster)
+        include_self_pairs (bool, optional): also count the pairs (i, i) in the denominator, which gives the same prior and pi 
+            as return_priors_pi (but not the maximum of J_R_x_sparse). Defaults to False.
+
+    Returns:
+        prior, pi: the priors of size (n_cluster) and the connectivity matrix of size (n_cluster, n_cluster)
+    """
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[0], dtype = tau.dtype)
+
+    prior = torch.mean(tau, dim=0)
+
+    nominator = tau.T @ torch.sparse.mm(X, tau)
+
+    cluster_sizes = torch.sum(tau, dim=0)
+    denominator = torch.outer(cluster_sizes, cluster_sizes)
+    if not include_self_pairs:
+        denominator = denominator - tau.T @ tau
+
+    pi = nominator / (denominator + torch.finfo(torch.float64).eps)
+    # a cluster holding a single node has no pair i != j, up to rounding
+    pi[denominator <= 0] = 0
+
+    return prior, pi
+
 def return_priors_pi_from_graph(graph, tau):
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     tensor_tau = torch.Tensor(tau).to(device)
-    prior, pi = return_priors_pi(get_X_from_graph(graph), tensor_tau)
-    return prior.numpy(), pi.numpy()
+    prior, pi = return_priors_pi_sparse(nx.to_scipy_sparse_array(graph), tensor_tau)
+    return prior.to('cpu').numpy(), pi.to('cpu').numpy()
 
-def appro_tau(tau, graph_edges, pi, priors, eps = 1e-04, max_iter = 50):    
+def appro_tau(tau, graph_edges, pi, priors, eps = 1e-04, max_iter = 50, rtol = 0, return_n_iter = False):    
     
     finish = False
     current_iter = 0
+    # Floor of pi, kept apart from eps which is the convergence tolerance
+    log_eps = torch.finfo(torch.float32).eps
 
     while not finish and current_iter < max_iter:
         old_tau = tau
         # Create index arrays
-        eps = torch.finfo(torch.float32).eps
-        exp_term = ( (pi+eps) ** graph_edges[:, :, None, None]) * ((1 - pi + eps) ** (1 - graph_edges[:, :, None, None]))
+        exp_term = ( (pi+log_eps) ** graph_edges[:, :, None, None]) * ((1 - pi + log_eps) ** (1 - graph_edges[:, :, None, None]))
         K = exp_term ** old_tau[None, :, None, :]
 
         # Calculate the product along the specified axis
@@ -85,9 +136,117 @@ def appro_tau(tau, graph_edges, pi, priors, eps = 1e-04, max_iter = 50):
 
         # Calculate the difference and check convergence
         difference_matrix = torch.abs(tau - old_tau)
-        finish = torch.all(difference_matrix < eps)
+        finish = torch.all(difference_matrix <= eps + rtol * torch.abs(old_tau))
         current_iter += 1
         
+    if return_n_iter:
+        return tau, current_iter
+    return tau
+
+def get_sparse_X(graph_edges, n_nodes = None, dtype = torch.float64, format = 'adjacency'):
+    """Convert an adjacency to a symmetric torch sparse (COO) tensor without self loops
+
+    Args:
+        graph_edges: the graph, either a SparseGraph, a scipy sparse matrix (CSR, COO, ...), a torch sparse tensor,
+            or a dense np.array / torch tensor read according to format
+        n_nodes (int, optional): the number of vertices of an edge list, deduced from the largest vertex otherwise. Defaults to None.
+        dtype (torch.dtype, optional): dtype of the values. Defaults to torch.float64.
+        format (str, optional): how a dense array is read, 'adjacency' for an adjacency of size (n_vertices, n_vertices),
+            'edges' for an edge list of size (n_edges, 2) (or (n_edges, 3) with the weights in the last column) where each 
+            undirected edge is listed once. The sparse inputs ignore it. Defaults to 'adjacency'.
+
+    Returns:
+        torch sparse tensor: coalesced adjacency of size (n_vertices, n_vertices)
+    """
+    if isinstance(graph_edges, SparseGraph):
+        return graph_edges.to_torch(dtype = dtype)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    if isinstance(graph_edges, torch.Tensor):
+        device = graph_edges.device
+        if graph_edges.layout != torch.strided:
+            graph_edges = graph_edges.to_sparse_coo().coalesce()
+            rows, cols = graph_edges.indices()
+            values = graph_edges.values()
+            n_nodes = graph_edges.shape[0]
+            graph_edges = None
+    elif hasattr(graph_edges, 'tocoo'):
+        coo = graph_edges.tocoo()
+        rows = torch.from_numpy(coo.row.astype(np.int64)).to(device)
+        cols = torch.from_numpy(coo.col.astype(np.int64)).to(device)
+        values = torch.from_numpy(np.asarray(coo.data)).to(device)
+        n_nodes = coo.shape[0]
+        graph_edges = None
+    else:
+        graph_edges = torch.as_tensor(np.asarray(graph_edges), device=device)
+
+    if graph_edges is not None:
+        if format not in ('adjacency', 'edges'):
+            raise ValueError(f"Unknown format {format!r}, expected 'adjacency' or 'edges'")
+        if format == 'adjacency' and (graph_edges.dim() != 2 or graph_edges.shape[0] != graph_edges.shape[1]):
+            raise ValueError(f"A dense adjacency must be square, got the shape {tuple(graph_edges.shape)} (use format='edges' for an edge list)")
+        if format == 'edges':
+            u = graph_edges[:, 0].long()
+            v = graph_edges[:, 1].long()
+            w = graph_edges[:, 2] if graph_edges.shape[1] == 3 else torch.ones(u.shape[0], device=device)
+            rows, cols, values = torch.cat((u, v)), torch.cat((v, u)), torch.cat((w, w))
+            if n_nodes is None:
+                n_nodes = int(rows.max().item()) + 1 if rows.numel() > 0 else 0
+        else:
+            rows, cols = torch.nonzero(graph_edges, as_tuple=True)
+            values = graph_edges[rows, cols]
+            n_nodes = graph_edges.shape[0]
+
+    # The model is defined on pairs i != j, self loops are never used
+    off_diagonal = rows != cols
+    indices = torch.stack((rows[off_diagonal], cols[off_diagonal]))
+    X = torch.sparse_coo_tensor(indices, values[off_diagonal].to(dtype), (n_nodes, n_nodes), device=device, check_invariants=False)
+    return X.coalesce()
+
+def appro_tau_sparse(tau, graph_edges, pi, priors, eps = 1e-04, max_iter = 50, rtol = 0, return_n_iter = False):
+    """Fixed point on tau computed in log space from the neighbours of each node.
+
+    log tau_iq = log priors_q + sum_l N_il log(pi_ql) + sum_l (S_l - tau_il - N_il) log(1 - pi_ql)
+    with N = X tau the neighbours mass and S the cluster sizes, so that one iteration
+    costs O(|E| Q + n Q^2) and never builds the (n, n, Q, Q) tensor of appro_tau.
+
+    Args:
+        tau (torch tensor): last estimation of tau of size (n_vertices, n_cluster)
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        pi (torch tensor): connectivity matrix of size (n_cluster, n_cluster)
+        priors (torch tensor): priors of size (n_cluster)
+        eps (float, optional): absolute tolerance, stop when no entry of tau moves more than eps + rtol * |tau|. Defaults to 1e-04.
+        max_iter (int, optional): maximum number of fixed point iterations. Defaults to 50.
+        rtol (float, optional): relative tolerance on the entries of tau. Defaults to 0.
+        return_n_iter (bool, optional): also return the number of iterations done. Defaults to False.
+
+    Returns:
+        tau: the new estimation of tau, of size (n_vertices, n_cluster) (and the number of iterations if return_n_iter)
+    """
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[0], dtype = tau.dtype)
+
+    # Same floor as appro_tau so that both fixed points agree
+    log_eps = torch.finfo(torch.float32).eps
+    log_pi = torch.log(pi + log_eps)
+    log_one_minus_pi = torch.log(1 - pi + log_eps)
+    log_priors = torch.log(priors)
+
+    finish = False
+    current_iter = 0
+
+    while not finish and current_iter < max_iter:
+        old_tau = tau
+
+        neighbours = torch.sparse.mm(X, old_tau)
+        non_neighbours = old_tau.sum(dim=0, keepdim=True) - old_tau - neighbours
+
+        log_tau = log_priors + neighbours @ log_pi.T + non_neighbours @ log_one_minus_pi.T
+        tau = torch.softmax(log_tau, dim=1)
+
+        finish = torch.all(torch.abs(tau - old_tau) <= eps + rtol * torch.abs(old_tau))
+        current_iter += 1
+
+    if return_n_iter:
+        return tau, current_iter
     return tau
 
 def J_R_x(graph_edges, tau, pi, priors):
@@ -128,6 +287,43 @@ def J_R_x(graph_edges, tau, pi, priors):
 
     return J_R_x.item()
 
+def safe_log(x):
+    """log(x) where x > 0 and 0 elsewhere, the 0 log 0 = 0 convention used by J_R_x"""
+    log_x = torch.zeros_like(x)
+    non_zero_indices = x > 0
+    log_x[non_zero_indices] = torch.log(x[non_zero_indices])
+    return log_x
+
+def J_R_x_sparse(graph_edges, tau, pi, priors):
+    """
+    Lower bound J(R_X) computed from the block sufficient statistics of tau:
+    the edge mass tau^T X tau and the pair mass (sum tau)(sum tau)^T - tau^T tau
+    (pairs i != j), plus the prior and entropy terms. Costs O(|E| Q + n Q^2).
+
+    Unlike J_R_x, the entropy term is - sum tau log tau, so the value is the
+    bound that the EM iterations increase.
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        tau (torch tensor): tau of size (n_vertices, n_cluster)
+        pi (torch tensor): connectivity matrix of size (n_cluster, n_cluster)
+        priors (torch tensor): priors of size (n_cluster)
+
+    Returns:
+        float: the value of J(R_X)
+    """
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[0], dtype = tau.dtype)
+
+    edge_mass = tau.T @ torch.sparse.mm(X, tau)
+    cluster_sizes = torch.sum(tau, dim=0)
+    pair_mass = torch.outer(cluster_sizes, cluster_sizes) - tau.T @ tau
+
+    sum_tau_log_priors = torch.sum(cluster_sizes * safe_log(priors))
+    sum_tau_tau_log_b = torch.sum(edge_mass * safe_log(pi) + (pair_mass - edge_mass) * safe_log(1 - pi)) / 2
+    entropy = - torch.sum(tau * safe_log(tau))
+
+    return (sum_tau_log_priors + sum_tau_tau_log_b + entropy).item()
+
 def log_likehood(graph_edges, tau, pi, priors):
     # From tau we create Z
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -169,12 +365,490 @@ def ICL(graph_edges, tau, pi, priors):
     
     n_nodes, n_clusters = tau.shape
     
-    m_Q = -1/4 * (n_clusters + 1) * n_clusters * np.log(n_nodes * (n_nodes- 1 ) / 2) - (n_clusters - 1) / 2 * np.log(n_nodes)
-    
-    icl += m_Q
+    icl += ICL_penalty(n_nodes, n_clusters)
     
     return icl
+
+def ICL_penalty(n_nodes, n_clusters):
+    """The penalty m_Q of the ICL criterion for n_clusters classes on n_nodes nodes"""
+    return -1/4 * (n_clusters + 1) * n_clusters * np.log(n_nodes * (n_nodes- 1 ) / 2) - (n_clusters - 1) / 2 * np.log(n_nodes)
+
+def log_likehood_sparse(graph_edges, tau, pi, priors):
+    """
+    Complete-data log-likelihood with the hard labels argmax(tau), computed from
+    the block sizes and the (n_cluster, n_cluster) edge counts between blocks,
+    obtained in one pass over the edges. Costs O(|E| + Q^2).
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        tau (torch tensor or CompactTau): tau of size (n_vertices, n_cluster), a CompactTau giving its labels directly
+        pi (torch tensor): connectivity matrix of size (n_cluster, n_cluster)
+        priors (torch tensor): priors of size (n_cluster)
+
+    Returns:
+        float: the log-likelihood
+    """
+    n_nodes, n_clusters = tau.shape
+    if isinstance(tau, CompactTau):
+        pi, priors = torch.as_tensor(pi), torch.as_tensor(priors)
+        labels = torch.from_numpy(tau_labels(tau)).to(pi.device)
+        dtype = pi.dtype
+    else:
+        labels = torch.argmax(tau, dim=1)
+        dtype = tau.dtype
+    X = get_sparse_X(graph_edges, n_nodes = n_nodes, dtype = dtype)
+    rows, cols = X.indices()
+
+    block_sizes = torch.bincount(labels, minlength=n_clusters).to(dtype)
+    # Ordered pairs (i, j), so both counts are twice the number of unordered pairs
+    edge_counts = torch.bincount(labels[rows] * n_clusters + labels[cols], weights=X.values(), minlength=n_clusters * n_clusters)
+    edge_counts = edge_counts.view(n_clusters, n_clusters)
+    pair_counts = torch.outer(block_sizes, block_sizes) - torch.diag(block_sizes)
+
+    sum_z_log_priors = torch.sum(block_sizes * safe_log(priors))
+    sum_z_z_log_b = torch.sum(edge_counts * safe_log(pi) + (pair_counts - edge_counts) * safe_log(1 - pi)) / 2
+
+    return (sum_z_log_priors + sum_z_z_log_b).item()
+
+def ICL_sparse(graph_edges, tau, pi, priors):
+    """ICL criterion computed with log_likehood_sparse, in O(|E| + Q^2). tau can be a CompactTau"""
+    n_nodes, n_clusters = tau.shape
+    return log_likehood_sparse(graph_edges, tau, pi, priors) + ICL_penalty(n_nodes, n_clusters)
  
+def neighbours_mass_batched(X, tau):
+    """X tau for each restart, with tau of size (n_restarts, n_vertices, n_cluster), in one sparse product"""
+    n_restarts, n_nodes, n_clusters = tau.shape
+    stacked_tau = tau.permute(1, 0, 2).reshape(n_nodes, n_restarts * n_clusters)
+    return torch.sparse.mm(X, stacked_tau).reshape(n_nodes, n_restarts, n_clusters).permute(1, 0, 2)
+
+def return_priors_pi_batched(graph_edges, tau, include_self_pairs = False):
+    """
+    return_priors_pi_sparse for a batch of restarts
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        tau (torch tensor): tau of size (n_restarts, n_vertices, n_cluster)
+        include_self_pairs (bool, optional): see return_priors_pi_sparse. Defaults to False.
+
+    Returns:
+        prior, pi: of size (n_restarts, n_cluster) and (n_restarts, n_cluster, n_cluster)
+    """
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[1], dtype = tau.dtype)
+
+    prior = torch.mean(tau, dim=1)
+
+    nominator = tau.transpose(1, 2) @ neighbours_mass_batched(X, tau)
+
+    cluster_sizes = torch.sum(tau, dim=1)
+    denominator = cluster_sizes[:, :, None] * cluster_sizes[:, None, :]
+    if not include_self_pairs:
+        denominator = denominator - tau.transpose(1, 2) @ tau
+
+    pi = nominator / (denominator + torch.finfo(torch.float64).eps)
+    pi[denominator <= 0] = 0
+
+    return prior, pi
+
+def appro_tau_batched(tau, graph_edges, pi, priors, eps = 1e-04, max_iter = 50, rtol = 0, return_n_iter = False):
+    """
+    appro_tau_sparse for a batch of restarts, each restart leaves the fixed point as soon as it has converged
+
+    Args:
+        tau (torch tensor): tau of size (n_restarts, n_vertices, n_cluster)
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        pi (torch tensor): of size (n_restarts, n_cluster, n_cluster)
+        priors (torch tensor): of size (n_restarts, n_cluster)
+        eps, max_iter, rtol: see appro_tau_sparse
+        return_n_iter (bool, optional): also return the number of iterations of each restart. Defaults to False.
+
+    Returns:
+        tau: of size (n_restarts, n_vertices, n_cluster) (and a tensor with the number of iterations of each restart)
+    """
+    n_restarts = tau.shape[0]
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[1], dtype = tau.dtype)
+
+    log_eps = torch.finfo(torch.float32).eps
+    log_pi_T = torch.log(pi + log_eps).transpose(1, 2)
+    log_one_minus_pi_T = torch.log(1 - pi + log_eps).transpose(1, 2)
+    log_priors = torch.log(priors).unsqueeze(1)
+
+    tau = tau.clone()
+    active = torch.ones(n_restarts, dtype=torch.bool, device=tau.device)
+    n_iter = torch.zeros(n_restarts, dtype=torch.long, device=tau.device)
+    current_iter = 0
+
+    while torch.any(active) and current_iter < max_iter:
+        index = torch.nonzero(active).squeeze(1)
+        old_tau = tau[index]
+
+        neighbours = neighbours_mass_batched(X, old_tau)
+        non_neighbours = old_tau.sum(dim=1, keepdim=True) - old_tau - neighbours
+
+        log_tau = log_priors[index] + neighbours @ log_pi_T[index] + non_neighbours @ log_one_minus_pi_T[index]
+        new_tau = torch.softmax(log_tau, dim=2)
+        tau[index] = new_tau
+        n_iter[index] += 1
+
+        finish = torch.all((torch.abs(new_tau - old_tau) <= eps + rtol * torch.abs(old_tau)).flatten(1), dim=1)
+        active[index[finish]] = False
+        current_iter += 1
+
+    if return_n_iter:
+        return tau, n_iter
+    return tau
+
+def J_R_x_batched(graph_edges, tau, pi, priors):
+    """J_R_x_sparse for a batch of restarts, returns a tensor of size (n_restarts)"""
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[1], dtype = tau.dtype)
+
+    edge_mass = tau.transpose(1, 2) @ neighbours_mass_batched(X, tau)
+    cluster_sizes = torch.sum(tau, dim=1)
+    pair_mass = cluster_sizes[:, :, None] * cluster_sizes[:, None, :] - tau.transpose(1, 2) @ tau
+
+    sum_tau_log_priors = torch.sum(cluster_sizes * safe_log(priors), dim=1)
+    sum_tau_tau_log_b = torch.sum(edge_mass * safe_log(pi) + (pair_mass - edge_mass) * safe_log(1 - pi), dim=(1, 2)) / 2
+    entropy = - torch.sum(tau * safe_log(tau), dim=(1, 2))
+
+    return sum_tau_log_priors + sum_tau_tau_log_b + entropy
+
+def ICL_batched(graph_edges, tau, pi, priors):
+    """ICL_sparse for a batch of restarts, with all the block counts obtained by one bincount. Returns a np.array of size (n_restarts)"""
+    n_restarts, n_nodes, n_clusters = tau.shape
+    X = get_sparse_X(graph_edges, n_nodes = n_nodes, dtype = tau.dtype)
+    rows, cols = X.indices()
+
+    labels = torch.argmax(tau, dim=2)
+    offsets = torch.arange(n_restarts, device=tau.device)[:, None] * n_clusters
+    block_sizes = torch.bincount((labels + offsets).flatten(), minlength=n_restarts * n_clusters).to(tau.dtype).view(n_restarts, n_clusters)
+    pair_index = (offsets * n_clusters + labels[:, rows] * n_clusters + labels[:, cols]).flatten()
+    edge_counts = torch.bincount(pair_index, weights=X.values().repeat(n_restarts), minlength=n_restarts * n_clusters * n_clusters)
+    edge_counts = edge_counts.view(n_restarts, n_clusters, n_clusters)
+    pair_counts = block_sizes[:, :, None] * block_sizes[:, None, :] - torch.diag_embed(block_sizes)
+
+    sum_z_log_priors = torch.sum(block_sizes * safe_log(priors), dim=1)
+    sum_z_z_log_b = torch.sum(edge_counts * safe_log(pi) + (pair_counts - edge_counts) * safe_log(1 - pi), dim=(1, 2)) / 2
+
+    return (sum_z_log_priors + sum_z_z_log_b).to('cpu').numpy() + ICL_penalty(n_nodes, n_clusters)
+ 
+def dense_tile_rows(n_nodes, n_clusters, max_memory_bytes, itemsize = 8):
+    """
+    Number of rows of nodes per tile of the tiled dense kernels so that their peak memory stays below max_memory_bytes.
+    Each tiled kernel fills a single buffer of size (tile_rows, n_vertices, n_cluster, n_cluster) in place (see tile_buffer)
+    and reduces it to at most 2 tensors of size (tile_rows, n_vertices, n_cluster), next to the dense adjacency and
+    about 8 tensors of size (n_vertices, n_cluster).
+
+    Returns:
+        tile_rows, expected_peak_bytes
+    """
+    fixed_bytes = n_nodes * n_nodes * itemsize + 8 * n_nodes * n_clusters * itemsize
+    row_bytes = (n_nodes * n_clusters * n_clusters + 2 * n_nodes * n_clusters) * itemsize
+    tile_rows = int(min(n_nodes, max(1, (max_memory_bytes - fixed_bytes) // row_bytes)))
+    expected_peak_bytes = fixed_bytes + tile_rows * row_bytes
+    if expected_peak_bytes > max_memory_bytes:
+        warnings.warn(f'The dense kernels need at least {expected_peak_bytes} bytes for {n_nodes} nodes and {n_clusters} clusters, above max_memory_bytes = {max_memory_bytes}')
+    return tile_rows, expected_peak_bytes
+
+def tile_buffer(tau, tile_rows):
+    """The (tile_rows, n_vertices, n_cluster, n_cluster) buffer reused in place by the tiled kernels for every tile"""
+    n_nodes, n_cluster = tau.shape
+    return tau.new_empty((min(tile_rows, n_nodes), n_nodes, n_cluster, n_cluster))
+
+def return_priors_pi_tiled(graph_edges, tau, tile_rows, include_self_pairs = False):
+    """
+    return_priors_pi computed on blocks of tile_rows rows of nodes, so that theta never has more than
+    (tile_rows, n_vertices, n_cluster, n_cluster) entries. Gives the same prior and pi as return_priors_pi_sparse.
+
+    Args:
+        graph_edges (torch tensor): dense adjacency of size (n_vertices, n_vertices)
+        tau (torch tensor): last estimation of the tau of size (n_vertices, n_cluster)
+        tile_rows (int): the number of rows of a tile
+        include_self_pairs (bool, optional): see return_priors_pi_sparse, True gives the prior and pi of return_priors_pi. Defaults to False.
+
+    Returns:
+        prior, pi
+    """
+    n_nodes, n_cluster = tau.shape
+    prior = torch.mean(tau, dim=0)
+
+    nominator = torch.zeros((n_cluster, n_cluster), dtype=tau.dtype, device=tau.device)
+    denominator = torch.zeros((n_cluster, n_cluster), dtype=tau.dtype, device=tau.device)
+    buffer = tile_buffer(tau, tile_rows)
+    for start in range(0, n_nodes, tile_rows):
+        stop = min(start + tile_rows, n_nodes)
+        theta = torch.mul(tau[start:stop, None, :, None], tau[None, :, None, :], out=buffer[:stop - start])
+        denominator += torch.sum(theta, dim=(0, 1))
+        theta.mul_(graph_edges[start:stop, :, None, None])
+        nominator += torch.sum(theta, dim=(0, 1))
+    if not include_self_pairs:
+        denominator = denominator - tau.T @ tau
+
+    pi = torch.div(nominator, denominator + torch.finfo(torch.float64).eps)
+    pi[denominator <= 0] = 0
+
+    return prior, pi
+
+def appro_tau_tiled(tau, graph_edges, pi, priors, tile_rows, eps = 1e-04, max_iter = 50, rtol = 0, return_n_iter = False):
+    """appro_tau with the new tau computed on blocks of tile_rows rows of nodes, see return_priors_pi_tiled.
+
+    The product of appro_tau is taken in log space, log K_ijql = log(1 - pi_ql) + X_ij (log(pi_ql) - log(1 - pi_ql)),
+    so that each tile is built in place in the buffer of tile_buffer.
+    """
+    n_nodes = tau.shape[0]
+    log_eps = torch.finfo(torch.float32).eps
+    log_not_pi = torch.log(1 - pi + log_eps)
+    log_ratio = torch.log(pi + log_eps) - log_not_pi
+    log_priors = torch.log(priors)
+    buffer = tile_buffer(tau, tile_rows)
+
+    finish = False
+    current_iter = 0
+
+    while not finish and current_iter < max_iter:
+        old_tau = tau
+        log_tau = torch.empty_like(old_tau)
+        for start in range(0, n_nodes, tile_rows):
+            stop = min(start + tile_rows, n_nodes)
+            log_K = torch.mul(graph_edges[start:stop, :, None, None], log_ratio, out=buffer[:stop - start])
+            log_K.add_(log_not_pi).mul_(old_tau[None, :, None, :])
+            log_K = torch.sum(log_K, dim=3)
+            # The pairs (i, i) do not count
+            rows = torch.arange(stop - start, device=log_K.device)
+            log_K[rows, rows + start] = 0
+            log_tau[start:stop] = torch.sum(log_K, dim=1) + log_priors
+
+        tau = torch.softmax(log_tau, dim=1)
+
+        finish = torch.all(torch.abs(tau - old_tau) <= eps + rtol * torch.abs(old_tau))
+        current_iter += 1
+
+    if return_n_iter:
+        return tau, current_iter
+    return tau
+
+def sum_pairs_log_b_tiled(graph_edges, tau, pi, tile_rows):
+    """1/2 sum_{i != j} sum_ql tau_iq tau_jl log b(X_ij, pi_ql) as computed by J_R_x, on blocks of tile_rows rows of nodes.
+
+    For a binary adjacency, log b(X_ij, pi_ql) = X_ij log(pi_ql) + (1 - X_ij) log(1 - pi_ql) with the safe_log convention.
+    """
+    n_nodes = tau.shape[0]
+    log_not_pi = safe_log(1 - pi)
+    log_ratio = safe_log(pi) - log_not_pi
+    buffer = tile_buffer(tau, tile_rows)
+    total = torch.zeros((), dtype=tau.dtype, device=tau.device)
+    for start in range(0, n_nodes, tile_rows):
+        stop = min(start + tile_rows, n_nodes)
+        tau_tau_log_b = torch.mul(graph_edges[start:stop, :, None, None], log_ratio, out=buffer[:stop - start])
+        tau_tau_log_b.add_(log_not_pi).mul_(tau[start:stop, None, :, None]).mul_(tau[None, :, None, :])
+        rows = torch.arange(stop - start, device=tau.device)
+        tau_tau_log_b[rows, rows + start] = 0
+        total += torch.sum(tau_tau_log_b)
+    return total / 2
+
+def J_R_x_tiled(graph_edges, tau, pi, priors, tile_rows, entropy_sign = -1):
+    """J(R_X) computed on blocks of tile_rows rows of nodes.
+
+    With the default entropy_sign = -1, the entropy term is - sum tau log tau and the value is the bound 
+    given by J_R_x_sparse. entropy_sign = 1 gives the value of J_R_x, which adds sum tau log tau.
+    """
+    sum_tau_log_priors = torch.sum(tau * safe_log(priors))
+    sum_tau_log_tau = torch.sum(tau * safe_log(tau))
+    return (sum_tau_log_priors + sum_pairs_log_b_tiled(graph_edges, tau, pi, tile_rows) + entropy_sign * sum_tau_log_tau).item()
+
+# Number of edges processed at once by the top-k kernels, which hold O(chunk_edges k^2) entries per chunk
+TOPK_CHUNK_EDGES = 2**16
+
+def topk_tau(tau, k):
+    """
+    The k largest entries of each row of a dense tau, renormalised so that each row sums to one:
+    the mass of the other clusters is given back to the kept ones.
+
+    Args:
+        tau (torch tensor): tau of size (n_vertices, n_cluster)
+        k (int): the number of clusters kept per node
+
+    Returns:
+        indices, values: the kept clusters and their probabilities, both of size (n_vertices, k)
+    """
+    values, indices = torch.topk(tau, k, dim=1)
+    values = values / torch.clamp(values.sum(dim=1, keepdim=True), min=torch.finfo(values.dtype).tiny)
+    return indices, values
+
+def topk_to_dense(indices, values, n_clusters):
+    """The dense tau of size (n_vertices, n_cluster) of a top-k tau"""
+    tau = torch.zeros((indices.shape[0], n_clusters), dtype=values.dtype, device=values.device)
+    return tau.scatter_add_(1, indices, values)
+
+def topk_union(indices, values, new_indices, new_values):
+    """
+    The entries of two top-k taus on the union of their clusters, in O(n k^2): every entry kept by one of them 
+    is given with its value in both (0 where the other one dropped it), the entries kept by both appearing twice.
+
+    Returns:
+        old, new: the values of tau and new_tau on these entries, both of size (n_vertices, 2k)
+    """
+    same = indices[:, :, None] == new_indices[:, None, :]
+    new_at_old = torch.sum(same * new_values[:, None, :], dim=2)
+    old_at_new = torch.sum(same * values[:, :, None], dim=1)
+    return torch.cat((values, old_at_new), dim=1), torch.cat((new_at_old, new_values), dim=1)
+
+def topk_max_difference(indices, values, new_indices, new_values):
+    """max |new_tau - tau| over all the entries of two top-k taus, in O(n k^2)"""
+    old, new = topk_union(indices, values, new_indices, new_values)
+    return torch.max(torch.abs(new - old)).item()
+
+def topk_block_masses(X, indices, values, n_clusters, chunk_edges = TOPK_CHUNK_EDGES):
+    """
+    Sufficient statistics of a top-k tau: the cluster sizes sum tau, the edge mass tau^T X tau and tau^T tau, 
+    obtained by scattering the k^2 pairs of clusters of every edge and of every node. Costs O(|E| k^2 + n k^2 + Q^2),
+    the edges being scattered chunk_edges at a time.
+
+    Returns:
+        cluster_sizes, edge_mass, self_mass: of size (n_cluster), (n_cluster, n_cluster) and (n_cluster, n_cluster)
+    """
+    rows, cols = X.indices()
+    cluster_sizes = torch.zeros(n_clusters, dtype=values.dtype, device=values.device).index_add_(0, indices.flatten(), values.flatten())
+
+    x_values = X.values()
+    edge_mass = torch.zeros(n_clusters * n_clusters, dtype=values.dtype, device=values.device)
+    for start in range(0, len(rows), chunk_edges):
+        chunk_rows, chunk_cols = rows[start:start + chunk_edges], cols[start:start + chunk_edges]
+        pairs = (indices[chunk_rows][:, :, None] * n_clusters + indices[chunk_cols][:, None, :]).flatten()
+        mass = (values[chunk_rows][:, :, None] * values[chunk_cols][:, None, :] * x_values[start:start + chunk_edges, None, None]).flatten()
+        edge_mass.index_add_(0, pairs, mass)
+
+    pairs = (indices[:, :, None] * n_clusters + indices[:, None, :]).flatten()
+    mass = (values[:, :, None] * values[:, None, :]).flatten()
+    self_mass = torch.zeros(n_clusters * n_clusters, dtype=values.dtype, device=values.device).index_add_(0, pairs, mass)
+    return cluster_sizes, edge_mass.view(n_clusters, n_clusters), self_mass.view(n_clusters, n_clusters)
+
+def return_priors_pi_topk(graph_edges, indices, values, n_clusters, include_self_pairs = False):
+    """return_priors_pi_sparse for a top-k tau (see topk_tau), in O(|E| k^2 + n k^2 + Q^2)
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        indices, values (torch tensor): the top-k tau, of size (n_vertices, k)
+        n_clusters (int): the number of clusters
+        include_self_pairs (bool, optional): see return_priors_pi_sparse. Defaults to False.
+
+    Returns:
+        prior, pi: the priors of size (n_cluster) and the connectivity matrix of size (n_cluster, n_cluster)
+    """
+    X = get_sparse_X(graph_edges, n_nodes = indices.shape[0], dtype = values.dtype)
+    cluster_sizes, edge_mass, self_mass = topk_block_masses(X, indices, values, n_clusters)
+
+    prior = cluster_sizes / indices.shape[0]
+    denominator = torch.outer(cluster_sizes, cluster_sizes)
+    if not include_self_pairs:
+        denominator = denominator - self_mass
+    pi = edge_mass / (denominator + torch.finfo(torch.float64).eps)
+    pi[denominator <= 0] = 0
+
+    return prior, pi
+
+def J_R_x_topk(graph_edges, indices, values, pi, priors):
+    """J_R_x_sparse for a top-k tau (see topk_tau), in O(|E| k^2 + n k^2 + Q^2)"""
+    n_clusters = pi.shape[0]
+    X = get_sparse_X(graph_edges, n_nodes = indices.shape[0], dtype = values.dtype)
+    cluster_sizes, edge_mass, self_mass = topk_block_masses(X, indices, values, n_clusters)
+    pair_mass = torch.outer(cluster_sizes, cluster_sizes) - self_mass
+
+    sum_tau_log_priors = torch.sum(cluster_sizes * safe_log(priors))
+    sum_tau_tau_log_b = torch.sum(edge_mass * safe_log(pi) + (pair_mass - edge_mass) * safe_log(1 - pi)) / 2
+    entropy = - torch.sum(values * safe_log(values))
+
+    return (sum_tau_log_priors + sum_tau_tau_log_b + entropy).item()
+
+def topk_candidates(X, indices, values, n_clusters, chunk_edges = TOPK_CHUNK_EDGES):
+    """
+    The clusters among which the top-k E-step looks for the new top-k of each node: its current k clusters and the k clusters
+    holding the largest neighbours mass N = X tau. Also returns N as a sparse tensor of size (n_vertices, n_cluster),
+    summed chunk_edges edges at a time.
+
+    Returns:
+        candidates, N: the candidates of size (n_vertices, 2k), sorted in each row (a cluster can appear twice), and N
+    """
+    n_nodes, k = indices.shape
+    rows, cols = X.indices()
+    x_values = X.values()
+    N = torch.sparse_coo_tensor(torch.empty((2, 0), dtype=rows.dtype, device=rows.device), values.new_empty(0), (n_nodes, n_clusters)).coalesce()
+    for start in range(0, len(rows), chunk_edges):
+        chunk_rows, chunk_cols = rows[start:start + chunk_edges], cols[start:start + chunk_edges]
+        chunk_N = torch.sparse_coo_tensor(torch.stack((chunk_rows.repeat_interleave(k), indices[chunk_cols].flatten())),
+                                          (x_values[start:start + chunk_edges, None] * values[chunk_cols]).flatten(), (n_nodes, n_clusters), check_invariants=False)
+        N = (N + chunk_N).coalesce()
+    N_rows, N_cols = N.indices()
+
+    # the k largest entries of each row of N, the rows with fewer entries being completed with the current clusters
+    order = torch.argsort(-N.values(), stable=True)
+    order = order[torch.argsort(N_rows[order], stable=True)]
+    row_starts = torch.searchsorted(N_rows[order], torch.arange(n_nodes, device=N_rows.device))
+    rank = torch.arange(len(order), device=order.device) - row_starts[N_rows[order]]
+    kept = order[rank < k]
+    neighbours_candidates = indices.clone()
+    neighbours_candidates[N_rows[kept], rank[rank < k]] = N_cols[kept]
+
+    candidates, _ = torch.sort(torch.cat((indices, neighbours_candidates), dim=1), dim=1)
+    return candidates, N
+
+def appro_tau_topk(indices, values, graph_edges, pi, priors, eps = 1e-04, max_iter = 50, rtol = 0, return_n_iter = False, chunk_edges = TOPK_CHUNK_EDGES):
+    """Fixed point of appro_tau_sparse where every node only keeps its top-k clusters (see topk_tau).
+
+    With L = log(1 - pi), W = log(pi) - L and S the cluster sizes, the log of tau is
+    log tau_iq = log priors_q + (L S)_q + sum_l N_il W_ql - sum_l tau_il L_ql.
+    It is only evaluated for the 2k candidates of each node (see topk_candidates), and the k best ones are kept
+    after the softmax. The fixed point stops with the test of appro_tau_sparse, on every entry kept before or after the iteration.
+    One iteration costs O(|E| k^2 + n k^2 + Q^2) against O(|E| Q + n Q^2) for appro_tau_sparse, so the top-k kernels 
+    are only faster when k^2 < Q.
+
+    Args:
+        indices, values (torch tensor): the top-k tau, of size (n_vertices, k)
+        graph_edges, pi, priors, eps, max_iter, rtol, return_n_iter: see appro_tau_sparse
+        chunk_edges (int, optional): the number of edges, and of entries of N, processed at once. Defaults to TOPK_CHUNK_EDGES.
+
+    Returns:
+        indices, values: the new top-k tau (and the number of iterations if return_n_iter)
+    """
+    n_nodes, k = indices.shape
+    n_clusters = pi.shape[0]
+    X = get_sparse_X(graph_edges, n_nodes = n_nodes, dtype = values.dtype)
+
+    # Same floor as appro_tau_sparse
+    log_eps = torch.finfo(torch.float32).eps
+    L = torch.log(1 - pi + log_eps)
+    W = torch.log(pi + log_eps) - L
+    log_priors = torch.log(priors)
+
+    finish = False
+    current_iter = 0
+
+    while not finish and current_iter < max_iter:
+        old_indices, old_values = indices, values
+
+        cluster_sizes = torch.zeros(n_clusters, dtype=values.dtype, device=values.device).index_add_(0, old_indices.flatten(), old_values.flatten())
+        candidates, N = topk_candidates(X, old_indices, old_values, n_clusters, chunk_edges)
+        N_rows, N_cols = N.indices()
+        N_values = N.values()
+
+        log_tau = (log_priors + L @ cluster_sizes)[candidates]
+        log_tau -= torch.sum(old_values[:, None, :] * L[candidates[:, :, None], old_indices[:, None, :]], dim=2)
+        for start in range(0, len(N_rows), chunk_edges):
+            chunk_rows = N_rows[start:start + chunk_edges]
+            log_tau.index_add_(0, chunk_rows, N_values[start:start + chunk_edges, None] * W[candidates[chunk_rows], N_cols[start:start + chunk_edges, None]])
+        # a cluster that is a candidate twice only counts once
+        log_tau[:, 1:][candidates[:, 1:] == candidates[:, :-1]] = -torch.inf
+
+        values, position = torch.topk(torch.softmax(log_tau, dim=1), k, dim=1)
+        indices = torch.gather(candidates, 1, position)
+        values = values / values.sum(dim=1, keepdim=True)
+
+        old, new = topk_union(old_indices, old_values, indices, values)
+        finish = torch.all(torch.abs(new - old) <= eps + rtol * torch.abs(old))
+        current_iter += 1
+
+    if return_n_iter:
+        return indices, values, current_iter
+    return indices, values
+
 def from_tau_to_Z(tau):
     max_values = torch.max(tau, dim=1, keepdim=True)[0]
     mask = (tau == max_values)
@@ -195,13 +869,26 @@ def calculated_empirical_clustering_coefficient(priors, pi):
         return num / den
     return 0
    
-def main(graph_edges, n_clusters, max_iter = 100, method = "spectral"):
-    n_nodes, _ = graph_edges.shape
+def to_sparse_graph(graph_edges, format = 'adjacency'):
+    """SparseGraph of a networkx graph, of a folder of edge shards (see SparseGraph.load) or of any adjacency 
+    accepted by get_sparse_X, a dense array being read according to format (a SparseGraph is returned as is)"""
+    if isinstance(graph_edges, SparseGraph):
+        return graph_edges
+    if isinstance(graph_edges, (str, os.PathLike)):
+        return SparseGraph.load(graph_edges)
+    if isinstance(graph_edges, nx.Graph):
+        return SparseGraph.from_networkx(graph_edges)
+    X = get_sparse_X(graph_edges, format = format)
+    rows, cols = X.indices().to('cpu').numpy()
+    return SparseGraph.from_scipy(coo_array((X.values().to('cpu').numpy(), (rows, cols)), shape=X.shape))
 
-    G = nx.from_numpy_array(graph_edges.to('cpu').numpy())
-    
-    # Initialize tau 
-    if method == "spectral":
+def initialise_tau(G, n_clusters, method, precomputed = None):
+    """First value of tau, of size (n_vertices, n_clusters), given by the initialisation method on G (networkx graph or SparseGraph).
+    precomputed can hold the initialisation_precomputed of the method (e.g. from an InitialisationCache), only its cheap final step is then run."""
+    n_nodes = G.number_of_nodes()
+    if precomputed is not None and (method != "spectral" or precomputed.shape[1] >= n_clusters):
+        tau = tau_from_precomputed(precomputed, n_clusters, method)
+    elif method == "spectral":
         tau = spectral_clustering(G, n_clusters)
     elif method == "random":
         tau = np.random.uniform(0, 1, size=(n_nodes, n_clusters))
@@ -210,32 +897,464 @@ def main(graph_edges, n_clusters, max_iter = 100, method = "spectral"):
         tau = hierarchical_clustering(G, n_clusters)
     elif method == 'modularity':
         tau = modularity_module(G, n_clusters)
+    return tau
+
+def clock(device):
+    """time.perf_counter, once the work queued on the GPU is done"""
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return time.perf_counter()
+
+def reset_peak_memory(device):
+    """Start a new peak for peak_memory_bytes: the peak allocated by torch on a GPU, the peak resident set size (VmHWM) on Linux
+
+    Returns:
+        bool: whether the peak could be reset, it cannot on the other platforms
+    """
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+        return True
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+def peak_memory_bytes(device):
+    """The peak memory allocated by torch on a GPU, or the peak resident set size of the process on Linux (None if unknown), 
+    since the last reset_peak_memory"""
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def process_peak_memory_bytes():
+    """The peak resident set size of the process since it started (None if unknown)"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def iteration_event(n_clusters, method, iteration, jrx, n_iter_tau, tau, new_tau, device, peak_reset, time_m_step, time_e_step, time_objective):
+    """The event given to the callbacks of main after each EM iteration
+
+    Returns:
+        dict: 'n_clusters', 'initialisation', the outer 'iteration', its 'jrx', the 'n_iter_tau' of its fixed point, 
+        the time in seconds of its 'time_m_step', 'time_e_step' and 'time_objective', the 'peak_memory_bytes' of the iteration 
+        (see peak_memory_bytes, None when peak_reset is False, i.e. reset_peak_memory could not reset it), the 'process_peak_memory_bytes' 
+        of the process since it started (see process_peak_memory_bytes) and the 'max_delta_tau', largest change of tau made by its E-step 
+        (tau being dense or top-k, see topk_tau)
+    """
+    if isinstance(tau, tuple):
+        max_delta_tau = topk_max_difference(*tau, *new_tau)
+    else:
+        max_delta_tau = torch.max(torch.abs(new_tau - tau)).item()
+    return {'n_clusters' : n_clusters, 'initialisation' : method, 'iteration' : iteration, 'jrx' : jrx, 'n_iter_tau' : n_iter_tau,
+            'time_m_step' : time_m_step, 'time_e_step' : time_e_step, 'time_objective' : time_objective,
+            'peak_memory_bytes' : peak_memory_bytes(device) if peak_reset else None, 'process_peak_memory_bytes' : process_peak_memory_bytes(), 
+            'max_delta_tau' : max_delta_tau}
+
+class TraceRecorder():
+    def __init__(self, path = None):
+        """Callback keeping the events of the EM iterations (see iteration_event). 
+        Given to a mixtureModel, it also stores the events of each fit in model.results[n_clusters]['trace'].
+
+        Args:
+            path (str, optional): a JSONL file to which every event is appended as one line. Defaults to None.
+        """
+        self.path = path
+        self.events = []
+        self.fit_events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+        self.fit_events.append(event)
+        if self.path is not None:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+
+    def end_fit(self, result):
+        """Called by run_EM at the end of a fit, moves its events to the results entry"""
+        result['trace'] = self.fit_events
+        self.fit_events = []
+
+def main(graph_edges, n_clusters, max_iter = 100, method = "spectral", rtol = 1e-06, atol = 0, eps_tau = 1e-04, rtol_tau = 0, max_iter_tau = 50, tau_init = None, max_memory_bytes = None, callbacks = None, precomputed = None, tau_top_k = None):
+    """Run the variational EM algorithm
+
+    The outer loop stops after max_iter iterations, or as soon as J(R_X) moves
+    by less than atol + rtol * |J(R_X)| between two iterations.
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X (dense tensor, scipy CSR, ...)
+        n_clusters (int): the number of clusters
+        max_iter (int, optional): maximum number of EM iterations. Defaults to 100.
+        method (str, optional): the initialisation method. Defaults to "spectral".
+        rtol (float, optional): relative tolerance on J(R_X). Defaults to 1e-06.
+        atol (float, optional): absolute tolerance on J(R_X). Defaults to 0.
+        eps_tau (float, optional): absolute tolerance of the fixed point on tau. Defaults to 1e-04.
+        rtol_tau (float, optional): relative tolerance of the fixed point on tau. Defaults to 0.
+        max_iter_tau (int, optional): maximum number of iterations of the fixed point on tau. Defaults to 50.
+        tau_init (np.array, optional): first value of tau, of size (n_vertices, n_clusters), used instead of the initialisation method. Defaults to None.
+        max_memory_bytes (int, optional): if given, run the dense kernels on tiles of rows of nodes sized so that
+        the EM fits in max_memory_bytes (see dense_tile_rows), instead of the sparse kernels. Defaults to None.
+        callbacks (list, optional): functions called with the event of each EM iteration (see iteration_event). Defaults to None.
+        precomputed (np.array, optional): the initialisation_precomputed of the method, reused by the initialisation (see initialise_tau). Defaults to None.
+        tau_top_k (int, optional): if smaller than n_clusters, every node only keeps its tau_top_k most likely clusters during the EM
+        (see topk_tau and appro_tau_topk), so that an iteration costs O(|E| tau_top_k^2) instead of O(|E| n_clusters), 
+        which is only faster when tau_top_k^2 < n_clusters. 
+        Cannot be used with max_memory_bytes. Defaults to None.
+
+    Returns:
+        priors, pi, tau, tab_jrx, info: info holds the number of EM iterations 'n_iter', the number of
+        fixed point iterations of each of them 'n_iter_tau', whether the EM 'converged', the 'time_initialisation' and,
+        with max_memory_bytes, the 'tile_rows' and the 'expected_peak_bytes' of the dense kernels. With tau_top_k, tau is
+        given back dense, with zeros outside the tau_top_k clusters of each node
+    """
+    if tau_top_k is not None and max_memory_bytes is not None:
+        raise ValueError("tau_top_k and max_memory_bytes cannot be used together")
+    graph = to_sparse_graph(graph_edges)
+    callbacks = [] if callbacks is None else callbacks
+
+    # Initialize tau 
+    start = time.perf_counter()
+    if tau_init is None:
+        tau = initialise_tau(graph, n_clusters, method, precomputed)
+    else:
+        tau = np.array(tau_init, dtype=np.float64)
+    time_initialisation = time.perf_counter() - start
         
     finished = False
     current_iter = 0
     tab_jrx = []
+    tab_iter_tau = []
     
     # Define the target device (CPU or CUDA/GPU)
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     # Move 'tau' and 'X' tensors to the target device
     tau = torch.from_numpy(tau).to(device)
-    graph_edges = torch.Tensor(graph_edges).to(device)
+    sparse_edges = graph.to_torch(device = device, dtype = tau.dtype)
+    tiled = max_memory_bytes is not None
+    if tiled:
+        tile_rows, expected_peak_bytes = dense_tile_rows(graph.number_of_nodes(), n_clusters, max_memory_bytes, tau.element_size())
+        dense_edges = sparse_edges.to_dense()
+    topk = tau_top_k is not None and tau_top_k < n_clusters
+    if topk:
+        tau = topk_tau(tau, tau_top_k)
  
     while current_iter < max_iter and not finished:
-        priors, pi = return_priors_pi(graph_edges, tau)
-        
-        tab_jrx.append(J_R_x(graph_edges, tau, pi, priors))
-        new_tau = appro_tau(tau, graph_edges, pi, priors)
-        # new_tau = approximate_tau_step_by_step(tau.copy(), X, pi.copy(), priors.copy())
-        
-        if torch.any(torch.isnan(new_tau)):
+        peak_reset = reset_peak_memory(device)
+        start = clock(device)
+        if tiled:
+            priors, pi = return_priors_pi_tiled(dense_edges, tau, tile_rows)
+        elif topk:
+            priors, pi = return_priors_pi_topk(sparse_edges, *tau, n_clusters)
+        else:
+            priors, pi = return_priors_pi_sparse(sparse_edges, tau)
+        end_m_step = clock(device)
+        if tiled:
+            tab_jrx.append(J_R_x_tiled(dense_edges, tau, pi, priors, tile_rows))
+        elif topk:
+            tab_jrx.append(J_R_x_topk(sparse_edges, *tau, pi, priors))
+        else:
+            tab_jrx.append(J_R_x_sparse(sparse_edges, tau, pi, priors))
+        end_objective = clock(device)
+        finished = len(tab_jrx) > 1 and abs(tab_jrx[-1] - tab_jrx[-2]) <= atol + rtol * abs(tab_jrx[-2])
+
+        new_tau, n_iter_tau, end_e_step = tau, 0, end_objective
+        if not finished:
+            if tiled:
+                new_tau, n_iter_tau = appro_tau_tiled(tau, dense_edges, pi, priors, tile_rows, eps = eps_tau, max_iter = max_iter_tau, rtol = rtol_tau, return_n_iter = True)
+            elif topk:
+                *new_tau, n_iter_tau = appro_tau_topk(*tau, sparse_edges, pi, priors, eps = eps_tau, max_iter = max_iter_tau, rtol = rtol_tau, return_n_iter = True)
+                new_tau = tuple(new_tau)
+            else:
+                new_tau, n_iter_tau = appro_tau_sparse(tau, sparse_edges, pi, priors, eps = eps_tau, max_iter = max_iter_tau, rtol = rtol_tau, return_n_iter = True)
+            # new_tau = approximate_tau_step_by_step(tau.copy(), X, pi.copy(), priors.copy())
+            tab_iter_tau.append(n_iter_tau)
+            end_e_step = clock(device)
+
+        if len(callbacks) > 0:
+            event = iteration_event(n_clusters, method, current_iter, tab_jrx[-1], n_iter_tau, tau, new_tau, device, peak_reset,
+                                    end_m_step - start, end_e_step - end_objective, end_objective - end_m_step)
+            for callback in callbacks:
+                callback(event)
+
+        if finished or torch.any(torch.isnan(new_tau[1] if topk else new_tau)):
             break
     
         tau = new_tau
 
         current_iter += 1
-    return priors, pi, tau, tab_jrx
+    if topk:
+        tau = topk_to_dense(*tau, n_clusters)
+    info = {'n_iter' : len(tab_jrx), 'n_iter_tau' : tab_iter_tau, 'converged' : finished, 'time_initialisation' : time_initialisation}
+    if tiled:
+        info['tile_rows'] = tile_rows
+        info['expected_peak_bytes'] = expected_peak_bytes
+    return priors, pi, tau, tab_jrx, info
+
+def main_batched(graph_edges, n_clusters, n_restarts, max_iter = 100, method = "random", rtol = 1e-06, atol = 0, eps_tau = 1e-04, rtol_tau = 0, max_iter_tau = 50, precomputed = None, callbacks = None):
+    """Run n_restarts variational EM algorithms as one batched computation.
+    Each restart stops on its own convergence criterion (see main) and then stops costing anything.
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        n_clusters (int): the number of clusters
+        n_restarts (int): the number of initialisations
+        max_iter, method, rtol, atol, eps_tau, rtol_tau, max_iter_tau: see main
+        precomputed (optional): the initialisation_precomputed shared by the restarts, e.g. the 'spectral' ones only differ by their k-means, 
+        or a list with the one of every restart (see restart_params). Defaults to None.
+        callbacks (list, optional): functions called after each EM iteration with the event (see iteration_event) of every restart
+        still running, which also holds its 'restart'. The times are those of the batched steps, shared by these restarts. Defaults to None.
+
+    Returns:
+        priors, pi, tau, tab_jrx, info: priors, pi and tau have a leading dimension of size n_restarts,
+        tab_jrx is a list with the J(R_X) trace of each restart, and info holds the lists 'n_iter', 'n_iter_tau' and 'converged'
+    """
+    graph = to_sparse_graph(graph_edges)
+    n_nodes = graph.number_of_nodes()
+    callbacks = [] if callbacks is None else callbacks
+
+    if method == "random":
+        tau = np.random.uniform(0, 1, size=(n_restarts, n_nodes, n_clusters))
+        tau = tau / tau.sum(axis=2, keepdims=True)
+    else:
+        if precomputed is None:
+            precomputed = initialisation_precomputed(graph, n_clusters, method)
+        if not isinstance(precomputed, list):
+            precomputed = [precomputed] * n_restarts
+        tau = np.stack([initialise_tau(graph, n_clusters, method, precomputed[r]) for r in range(n_restarts)])
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    tau = torch.from_numpy(tau).to(device)
+    sparse_edges = graph.to_torch(device = device, dtype = tau.dtype)
+
+    priors = torch.zeros((n_restarts, n_clusters), dtype=tau.dtype, device=device)
+    pi = torch.zeros((n_restarts, n_clusters, n_clusters), dtype=tau.dtype, device=device)
+    active = np.ones(n_restarts, dtype=bool)
+    converged = [False] * n_restarts
+    tab_jrx = [[] for _ in range(n_restarts)]
+    tab_iter_tau = [[] for _ in range(n_restarts)]
+    current_iter = 0
+
+    while current_iter < max_iter and np.any(active):
+        peak_reset = reset_peak_memory(device)
+        start = clock(device)
+        running = np.nonzero(active)[0]
+        priors[running], pi[running] = return_priors_pi_batched(sparse_edges, tau[running])
+        end_m_step = clock(device)
+
+        jrx = J_R_x_batched(sparse_edges, tau[running], pi[running], priors[running]).tolist()
+        end_objective = clock(device)
+        for r, value in zip(running, jrx):
+            tab_jrx[r].append(value)
+            if len(tab_jrx[r]) > 1 and abs(tab_jrx[r][-1] - tab_jrx[r][-2]) <= atol + rtol * abs(tab_jrx[r][-2]):
+                converged[r] = True
+                active[r] = False
+
+        index = np.nonzero(active)[0]
+        new_tau, n_iter_tau, end_e_step = tau[index], torch.zeros(len(index), dtype=torch.long), end_objective
+        if len(index) > 0:
+            new_tau, n_iter_tau = appro_tau_batched(tau[index], sparse_edges, pi[index], priors[index], eps = eps_tau, max_iter = max_iter_tau, rtol = rtol_tau, return_n_iter = True)
+            end_e_step = clock(device)
+
+        if len(callbacks) > 0:
+            # the restarts that converged at this iteration have no E-step
+            position = {r : k for k, r in enumerate(index)}
+            for r, value in zip(running, jrx):
+                k = position.get(r)
+                event = iteration_event(n_clusters, method, current_iter, value, 0 if k is None else n_iter_tau[k].item(), tau[r], tau[r] if k is None else new_tau[k], 
+                                        device, peak_reset, end_m_step - start, end_e_step - end_objective, end_objective - end_m_step)
+                event['restart'] = int(r)
+                for callback in callbacks:
+                    callback(event)
+
+        if len(index) == 0:
+            break
+        is_nan = torch.any(torch.isnan(new_tau).flatten(1), dim=1).tolist()
+        for k, r in enumerate(index):
+            tab_iter_tau[r].append(n_iter_tau[k].item())
+            if is_nan[k]:
+                active[r] = False
+            else:
+                tau[r] = new_tau[k]
+
+        current_iter += 1
+    info = {'n_iter' : [len(jrx) for jrx in tab_jrx], 'n_iter_tau' : tab_iter_tau, 'converged' : converged}
+    return priors, pi, tau, tab_jrx, info
+
+def neighbours_mass_rows(graph, nodes, tau):
+    """(X tau)_i for the vertices i of nodes only, reading their rows of the SparseGraph. Costs O(their degrees * Q)"""
+    positions, cols, values = graph.rows(nodes)
+    indices = torch.from_numpy(np.stack((positions, cols))).to(tau.device)
+    X_rows = torch.sparse_coo_tensor(indices, torch.from_numpy(np.asarray(values)).to(device=tau.device, dtype=tau.dtype), (len(nodes), tau.shape[0]), check_invariants=False)
+    return torch.sparse.mm(X_rows, tau)
+
+def update_local_tau(graph, tau, nodes, cluster_sizes, pi, priors, neighbours = None):
+    """One step of the fixed point of appro_tau_sparse on the rows nodes of tau only, done in place
+
+    Args:
+        graph (SparseGraph): the graph
+        tau (torch tensor): tau of size (n_vertices, n_cluster), updated in place
+        nodes (np.array): the nodes to update
+        cluster_sizes (torch tensor): sum of tau over the vertices, of size (n_cluster)
+        pi (torch tensor): connectivity matrix of size (n_cluster, n_cluster)
+        priors (torch tensor): priors of size (n_cluster)
+        neighbours (torch tensor, optional): neighbours_mass_rows(graph, nodes, tau) if it is already known. Defaults to None.
+
+    Returns:
+        cluster_sizes: the sum of the updated tau over the vertices
+    """
+    index = torch.from_numpy(nodes).to(tau.device)
+    if neighbours is None:
+        neighbours = neighbours_mass_rows(graph, nodes, tau)
+    log_eps = torch.finfo(torch.float32).eps
+    old_tau = tau[index]
+    non_neighbours = cluster_sizes - old_tau - neighbours
+    new_tau = torch.softmax(torch.log(priors) + neighbours @ torch.log(pi + log_eps).T + non_neighbours @ torch.log(1 - pi + log_eps).T, dim=1)
+    if torch.any(torch.isnan(new_tau)):
+        return cluster_sizes
+    tau[index] = new_tau
+    return cluster_sizes + new_tau.sum(dim=0) - old_tau.sum(dim=0)
+
+def estimate_J_R_x(graph, tau, cluster_sizes, pi, priors, nodes):
+    """
+    Estimation of J(R_X) from the contributions of a sample of nodes only, scaled by n_vertices / len(nodes).
+    The contribution of i is tau_i log priors - tau_i log tau_i + 1/2 sum_j!=i sum_ql tau_iq tau_jl log b(X_ij, pi_ql).
+
+    Args:
+        graph (SparseGraph): the graph
+        tau (torch tensor): tau of size (n_vertices, n_cluster)
+        cluster_sizes (torch tensor): sum of tau over the vertices, of size (n_cluster)
+        pi (torch tensor): connectivity matrix of size (n_cluster, n_cluster)
+        priors (torch tensor): priors of size (n_cluster)
+        nodes (np.array): the sample of nodes
+
+    Returns:
+        float: the estimation of J(R_X)
+    """
+    tau_nodes = tau[torch.from_numpy(nodes).to(tau.device)]
+    neighbours = neighbours_mass_rows(graph, nodes, tau)
+    log_ratio = safe_log(pi) - safe_log(1 - pi)
+    log_one_minus_pi = safe_log(1 - pi)
+    pair_term = torch.sum(tau_nodes * (neighbours @ log_ratio.T + (cluster_sizes - tau_nodes) @ log_one_minus_pi.T)) / 2
+    local_terms = torch.sum(tau_nodes * safe_log(priors)) - torch.sum(tau_nodes * safe_log(tau_nodes)) + pair_term
+    return local_terms.item() * graph.number_of_nodes() / len(nodes)
+
+def main_online(graph_edges, n_clusters, batch_size = 1000, max_iter = 1000, method = "random", step_offset = 1, step_decay = 0.6, n_holdout = 1000, eval_every = 10, rtol = 1e-06, atol = 0, seed = None, callbacks = None):
+    """Stochastic variational EM, for graphs too large for a full pass at every iteration.
+
+    At each iteration, tau is updated on a batch of nodes from their neighbours and from the
+    cluster sizes (which hold the whole non-edge term, and are kept exact), then the edge and
+    pair masses of the M-step are replaced by (1 - rho) * old + rho * (batch estimate), with 
+    rho = (iteration + step_offset) ** -step_decay. An iteration costs O((batch_size + edges of the batch) Q + batch_size Q^2).
+    Every eval_every iterations, J(R_X) is estimated on held-out nodes (see estimate_J_R_x), which
+    never enter the batch estimates of the edge and pair masses and whose tau is only refreshed
+    before each estimation. The algorithm stops when this estimate moves by less than atol + rtol * |J(R_X)|.
+
+    Args:
+        graph_edges: the graph, a SparseGraph or anything accepted by to_sparse_graph
+        n_clusters (int): the number of clusters
+        batch_size (int, optional): the number of nodes sampled at each iteration. Defaults to 1000.
+        max_iter (int, optional): maximum number of iterations. Defaults to 1000.
+        method (str, optional): the initialisation method. Defaults to "random".
+        step_offset (float, optional): offset of the step size. Defaults to 1.
+        step_decay (float, optional): decay of the step size, in (0.5, 1]. Defaults to 0.6.
+        n_holdout (int, optional): the number of held-out nodes. Defaults to 1000.
+        eval_every (int, optional): number of iterations between two estimations of J(R_X). Defaults to 10.
+        rtol (float, optional): relative tolerance on the estimation of J(R_X). Defaults to 1e-06.
+        atol (float, optional): absolute tolerance on the estimation of J(R_X). Defaults to 0.
+        seed (int, optional): seed of the sampling of the nodes. Defaults to None.
+        callbacks (list, optional): functions called with the event (see iteration_event) of each iteration, which also holds its 'batch_size'. 
+        Its 'time_m_step' is the global step, its 'time_e_step' the local step on the batch, its 'max_delta_tau' the largest change of tau 
+        on the batch, and its 'jrx' the estimation of J(R_X) of the iteration (None when there is none). Defaults to None.
+
+    Returns:
+        priors, pi, tau, tab_jrx, info: tab_jrx holds the estimations of J(R_X), info the number of iterations 'n_iter' and 'converged'
+    """
+    graph = to_sparse_graph(graph_edges)
+    n_nodes = graph.number_of_nodes()
+    rng = np.random.default_rng(seed)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    callbacks = [] if callbacks is None else callbacks
+
+    tau = torch.from_numpy(initialise_tau(graph, n_clusters, method)).to(device)
+    cluster_sizes = tau.sum(dim=0)
+    # the parameters of the initial tau, kept if no batch is ever processed
+    priors, pi = return_priors_pi_sparse(graph.to_torch(device = device, dtype = tau.dtype), tau)
+
+    holdout = rng.choice(n_nodes, size=min(n_holdout, n_nodes // 2), replace=False)
+    is_holdout = np.zeros(n_nodes, dtype=bool)
+    is_holdout[holdout] = True
+
+    edge_mass, pair_mass = None, None
+    finished = False
+    tab_jrx = []
+    current_iter = 0
+
+    while current_iter < max_iter and not finished:
+        batch = np.unique(rng.integers(0, n_nodes, size=batch_size))
+        batch = batch[~is_holdout[batch]]
+        if len(batch) == 0:
+            current_iter += 1
+            continue
+        batch_index = torch.from_numpy(batch).to(device)
+        scale = n_nodes / len(batch)
+        peak_reset = reset_peak_memory(device)
+        start = clock(device)
+
+        # Global step, from the batch estimates of the edge and pair masses
+        tau_batch = tau[batch_index]
+        neighbours = neighbours_mass_rows(graph, batch, tau)
+        batch_edge_mass = scale * tau_batch.T @ neighbours
+        batch_pair_mass = scale * tau_batch.T @ (cluster_sizes - tau_batch)
+        if edge_mass is None:
+            edge_mass, pair_mass = batch_edge_mass, batch_pair_mass
+        else:
+            rho = (current_iter + step_offset) ** (-step_decay)
+            edge_mass = (1 - rho) * edge_mass + rho * batch_edge_mass
+            pair_mass = (1 - rho) * pair_mass + rho * batch_pair_mass
+        priors = cluster_sizes / n_nodes
+        pi = edge_mass / (pair_mass + torch.finfo(torch.float64).eps)
+        pi[pair_mass <= 0] = 0
+        end_m_step = clock(device)
+
+        # Local step on the batch
+        cluster_sizes = update_local_tau(graph, tau, batch, cluster_sizes, pi, priors, neighbours = neighbours)
+        end_e_step = clock(device)
+
+        current_iter += 1
+        jrx = None
+        if current_iter % eval_every == 0:
+            cluster_sizes = update_local_tau(graph, tau, holdout, cluster_sizes, pi, priors)
+            jrx = estimate_J_R_x(graph, tau, cluster_sizes, pi, priors, holdout)
+            tab_jrx.append(jrx)
+            if len(tab_jrx) > 1 and abs(tab_jrx[-1] - tab_jrx[-2]) <= atol + rtol * abs(tab_jrx[-2]):
+                finished = True
+        end_objective = clock(device)
+
+        if len(callbacks) > 0:
+            event = iteration_event(n_clusters, method, current_iter - 1, jrx, 1, tau_batch, tau[batch_index], device, peak_reset,
+                                    end_m_step - start, end_e_step - end_m_step, end_objective - end_e_step)
+            event['batch_size'] = len(batch)
+            for callback in callbacks:
+                callback(event)
+
+    # The held-out nodes get their tau from the final parameters
+    update_local_tau(graph, tau, holdout, cluster_sizes, pi, priors)
+    info = {'n_iter' : current_iter, 'converged' : finished}
+    return priors, pi, tau, tab_jrx, info
 
 def get_X_from_graph(graph):
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -250,39 +1369,351 @@ def get_X_from_graph(graph):
         
     return graph_edges
 
+def bisect_cluster(adjacency, members, profiles):
+    """Candidate splits of a cluster in two, as boolean masks over its members:
+    the sign of the Fiedler vector of the subgraph induced by the members, and a 2-means on their connectivity profiles"""
+    splits = []
+    sub_adjacency = adjacency[members][:, members]
+    degrees = np.asarray(sub_adjacency.sum(axis=1)).ravel()
+    if len(members) > 2 and np.all(degrees > 0):
+        inv_sqrt_degrees = 1 / np.sqrt(degrees)
+        normalised = sub_adjacency.multiply(inv_sqrt_degrees[:, None]).multiply(inv_sqrt_degrees[None, :]).tocsr()
+        _, vectors = np.linalg.eigh(normalised.toarray()) if len(members) < 500 else eigsh(normalised, k=2, which='LA')
+        splits.append(vectors[:, -2] > 0)
+    splits.append(KMeans(n_clusters=2, n_init=1).fit_predict(profiles[members]) == 1)
+    return [split for split in splits if 0 < split.sum() < len(members)]
+
+def split_cluster_tau(graph_edges, tau):
+    """Add one cluster to tau by splitting one of its clusters in two.
+
+    The members (argmax of tau) of every cluster are split in two with the cheap heuristics of
+    bisect_cluster, and the candidate with the best lower bound J(R_X) after one M-step is kept.
+
+    Args:
+        graph_edges: the graph, in any format accepted by get_sparse_X
+        tau (torch tensor): tau of size (n_vertices, n_cluster)
+
+    Returns:
+        tau: of size (n_vertices, n_cluster + 1)
+    """
+    X = get_sparse_X(graph_edges, n_nodes = tau.shape[0], dtype = tau.dtype)
+    rows, cols = X.indices().to('cpu').numpy()
+    adjacency = csr_array((X.values().to('cpu').numpy(), (rows, cols)), shape=X.shape)
+    labels = torch.argmax(tau, dim=1).to('cpu').numpy()
+    neighbours = torch.sparse.mm(X, tau)
+    n_pairs = torch.clamp(tau.sum(dim=0, keepdim=True) - tau, min=1)
+    profiles = (neighbours / n_pairs).to('cpu').numpy()
+
+    best_tau, best_jrx = None, -np.inf
+    for q in range(tau.shape[1]):
+        members = np.nonzero(labels == q)[0]
+        if len(members) < 2:
+            continue
+        for split in bisect_cluster(adjacency, members, profiles):
+            moved = torch.zeros(tau.shape[0], dtype=torch.bool, device=tau.device)
+            moved[torch.from_numpy(members[split]).to(tau.device)] = True
+
+            candidate = torch.cat((tau, torch.zeros_like(tau[:, :1])), dim=1)
+            candidate[moved, -1] = candidate[moved, q]
+            candidate[moved, q] = 0
+            priors, pi = return_priors_pi_sparse(X, candidate)
+            jrx = J_R_x_sparse(X, candidate, pi, priors)
+            if jrx > best_jrx:
+                best_tau, best_jrx = candidate, jrx
+
+    if best_tau is None:
+        # No cluster can be split, the new cluster stays empty
+        best_tau = torch.cat((tau, torch.zeros_like(tau[:, :1])), dim=1)
+    return best_tau
+
+def end_fit(callbacks, result):
+    """Give the results entry of a finished fit to the callbacks having an end_fit method (like TraceRecorder)"""
+    for callback in [] if callbacks is None else callbacks:
+        if hasattr(callback, 'end_fit'):
+            callback.end_fit(result)
+
+def run_EM(graph_edges, n_clusters, max_iter, initilisation_method, tolerances, tau_init = None, max_memory_bytes = None, callbacks = None, precomputed = None, tau_top_k = None):
+    """Run main() and compute the ICL, returns the results entry of a mixtureModel.
+    The callbacks having an end_fit method (like TraceRecorder) are then given the entry."""
+    callbacks = [] if callbacks is None else callbacks
+    priors, pi, tau, tab_jrx, info = main(graph_edges, n_clusters, max_iter = max_iter, method = initilisation_method, tau_init = tau_init, 
+                                          max_memory_bytes = max_memory_bytes, callbacks = callbacks, precomputed = precomputed, tau_top_k = tau_top_k, **tolerances)
+    ICL_clusters = ICL_sparse(graph_edges, tau, pi, priors)
+    result = {'pi': pi.to('cpu').numpy(), 'tau' : tau.to('cpu').numpy(), 'jrx' : tab_jrx, 'priors' : priors.to('cpu').numpy(), 'ICL' : ICL_clusters, 'max_iter' : max_iter, 'initialisation' : initilisation_method, 'n_clusters' : n_clusters,
+              'n_iter' : info['n_iter'], 'n_iter_tau' : info['n_iter_tau'], 'converged' : info['converged'], 'time_initialisation' : info['time_initialisation']}
+    if 'expected_peak_bytes' in info:
+        result['tile_rows'] = info['tile_rows']
+        result['expected_peak_bytes'] = info['expected_peak_bytes']
+    if tau_top_k is not None:
+        result['tau_top_k'] = tau_top_k
+    end_fit(callbacks, result)
+    return result
+
+def share_array(array):
+    """Copy a numpy array in a new shared memory block
+
+    Returns:
+        shm, description: the SharedMemory (to close and unlink once done) and the (name, shape, dtype) needed to attach to it
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+# State of a parallel_fit worker, set once by init_EM_worker
+_worker_state = {}
+
+def init_EM_worker(descriptions, shape, n_threads):
+    """Attach a worker to the shared CSR adjacency and limit its number of threads"""
+    torch.set_num_threads(n_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(n_threads)
+    except ImportError:
+        pass
+    shms = [shared_memory.SharedMemory(name=name) for name, _, _ in descriptions]
+    indptr, indices, data = [np.ndarray(array_shape, dtype=dtype, buffer=shm.buf) for shm, (_, array_shape, dtype) in zip(shms, descriptions)]
+    _worker_state['shms'] = shms
+    _worker_state['graph_edges'] = SparseGraph(indptr, indices, data, shape[0])
+
+def EM_worker(n_clusters, max_iter, initilisation_method, tolerances, max_memory_bytes = None, callbacks = None, precomputed = None, tau_top_k = None):
+    return run_EM(_worker_state['graph_edges'], n_clusters, max_iter, initilisation_method, tolerances, max_memory_bytes = max_memory_bytes, callbacks = callbacks, 
+                  precomputed = precomputed, tau_top_k = tau_top_k)
+
+def fit_summary(result, restart = None):
+    """The scalars of a results entry kept for every fit of precise_fit: its 'restart', 'ICL', 'n_iter', whether it 'converged' and its last 'jrx'"""
+    jrx = result['jrx']
+    return {'restart' : restart, 'ICL' : float(result['ICL']), 'n_iter' : int(result['n_iter']), 'converged' : bool(result['converged']), 
+            'jrx' : float(jrx[-1]) if len(jrx) > 0 else None}
+
+def rng_state():
+    """The states of the global numpy and torch generators used by the initialisations, as JSON values"""
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {'numpy' : [name, keys.tolist(), position, has_gauss, cached_gaussian], 'torch' : torch.get_rng_state().tolist()}
+
+def set_rng_state(state):
+    """Restore the generators from rng_state()"""
+    name, keys, position, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+    torch.set_rng_state(torch.tensor(state['torch'], dtype=torch.uint8))
+
 class mixtureModel():
-    def __init__(self, graph, max_iter_EM = 50, initilisation_method = 'random', use_GPU = True):
+    def __init__(self, graph, max_iter_EM = 50, initilisation_method = 'random', use_GPU = True, rtol_EM = 1e-06, atol_EM = 0, eps_tau = 1e-04, rtol_tau = 0, max_iter_tau = 50, max_memory_bytes = None, callbacks = None, init_cache = None, compact_tau_threshold = None, tau_top_k = None):
         """_summary_
 
         Args:
-            graph (nx graph): the graph on which you want to perfom your EM algorithm
+            graph (nx graph or SparseGraph): the graph on which you want to perfom your EM algorithm. It is converted once to a SparseGraph
             max_iter_EM (int, optional): The number of iterations for the EM algorithm. Defaults to 50.
             initilisation_method (str, optional): The initialisation method you want to use. Defaults to 'random'.
             use_GPU (bool, optional): Wheter or not you want to use GPU if you have access to GPU 
             (you may want to use_GPU=False if you have GPU memory issues) Defaults to True.
+            rtol_EM (float, optional): The EM stops when J(R_X) moves by less than atol_EM + rtol_EM * |J(R_X)|. Defaults to 1e-06.
+            atol_EM (float, optional): Absolute tolerance on J(R_X). Defaults to 0.
+            eps_tau (float, optional): Absolute tolerance of the fixed point on tau. Defaults to 1e-04.
+            rtol_tau (float, optional): Relative tolerance of the fixed point on tau. Defaults to 0.
+            max_iter_tau (int, optional): The maximum number of iterations of the fixed point on tau. Defaults to 50.
+            max_memory_bytes (int, optional): If given, the EM runs the dense kernels on tiles of nodes chosen so that 
+            one fit needs at most max_memory_bytes (see expected_peak_bytes), instead of the sparse kernels. Defaults to None.
+            callbacks (list, optional): Functions called with the event of each EM iteration (see iteration_event), 
+            e.g. a TraceRecorder. More can be added with add_callback. Defaults to None.
+            init_cache (InitialisationCache, optional): The cache of the expensive part of the initialisations (eigenvectors, dendrogram, 
+            Louvain hierarchy), shared by all the fits and restarts. Give one with a path to keep it on disk between runs, 
+            or to share it between models. Defaults to a new InitialisationCache().
+            compact_tau_threshold (float, optional): If given, the tau of the results (self.results, self.best_fits and the stores) 
+            are kept as CompactTau.from_dense(tau, compact_tau_threshold): labels plus the entries of the rows that are not one-hot. 
+            Use np.asarray (or to_dense) to get them back as dense arrays. Defaults to None, for dense arrays.
+            tau_top_k (int, optional): If given, every node only keeps its tau_top_k most likely clusters in the E-step and the M-step 
+            (see appro_tau_topk), so that an EM iteration costs O(|E| tau_top_k^2) instead of O(|E| n_clusters), which only pays off 
+            when tau_top_k^2 < n_clusters. Not used by EM_restarts (batched restarts) and EM_online, and not with max_memory_bytes. Defaults to None.
         """
+        if tau_top_k is not None and max_memory_bytes is not None:
+            raise ValueError("tau_top_k and max_memory_bytes cannot be used together")
         if use_GPU :
             DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         else:
             DEVICE = 'cpu'
         self.graph = graph
-        self.graph_edges = get_X_from_graph(graph)
+        self.sparse_graph = to_sparse_graph(graph)
         self.max_iter = max_iter_EM
+        self.tolerances = {'rtol' : rtol_EM, 'atol' : atol_EM, 'eps_tau' : eps_tau, 'rtol_tau' : rtol_tau, 'max_iter_tau' : max_iter_tau}
         self.initilisation_method = initilisation_method
+        self.max_memory_bytes = max_memory_bytes
+        self.callbacks = [] if callbacks is None else list(callbacks)
         self.results = {}
         self.ICL_values = {}
+        self.init_cache = InitialisationCache() if init_cache is None else init_cache
+        self.compact_tau_threshold = compact_tau_threshold
+        self.tau_top_k = tau_top_k
+        self.store = None
+        self.checkpoint = None
+        self.best_fits = {}
+        self.fit_summaries = {}
     
-    def EM(self, n_clusters, max_iter = None, initilisation_method = None):
+    def EM(self, n_clusters, max_iter = None, initilisation_method = None, tau_init = None, restart = None):
         if max_iter == None:
             max_iter = self.max_iter
         if initilisation_method == None:
             initilisation_method = self.initilisation_method
-        priors, pi, tau, tab_jrx = main(self.graph_edges, n_clusters, max_iter = max_iter, method = initilisation_method)
-        ICL_clusters = ICL(self.graph_edges, tau, pi, priors)
-        result = {'pi': pi.to('cpu').numpy(), 'tau' : tau.to('cpu').numpy(), 'jrx' : tab_jrx, 'priors' : priors.to('cpu').numpy(), 'ICL' : ICL_clusters, 'max_iter' : max_iter, 'initialisation' : initilisation_method, 'n_clusters' : n_clusters}
-        self.results[n_clusters] = result
+        self.set_result(n_clusters, run_EM(self.sparse_graph, n_clusters, max_iter, initilisation_method, self.tolerances, tau_init = tau_init, max_memory_bytes = self.max_memory_bytes, 
+                                           callbacks = self.callbacks, precomputed = self.precomputed(n_clusters, initilisation_method, restart), tau_top_k = self.tau_top_k))
+
+    def compact(self, result):
+        """Replace the tau of a results entry by a CompactTau if the model has a compact_tau_threshold, and return the entry"""
+        if self.compact_tau_threshold is not None and isinstance(result, dict) and not isinstance(result['tau'], CompactTau):
+            result['tau'] = CompactTau.from_dense(result['tau'], self.compact_tau_threshold)
+        return result
+
+    def set_result(self, n_clusters, result):
+        """Keep the results entry of n_clusters in self.results, and append it to self.store if there is one"""
+        self.results[n_clusters] = self.compact(result)
+        if self.store is not None:
+            self.store.append(result)
+
+    def keep_best_fit(self, method, n_clusters, result, top_k = 1):
+        """Keep result in self.best_fits[method][n_clusters], the list of the top_k fits with the best ICL so far (best first)"""
+        best = self.best_fits.setdefault(method, {}).setdefault(n_clusters, [])
+        if len(best) < top_k or result['ICL'] > best[-1]['ICL']:
+            best.append(self.compact(result))
+            best.sort(key=lambda entry : entry['ICL'], reverse=True)
+            del best[top_k:]
+
+    def add_fit_summary(self, method, n_clusters, summary):
+        """Add the fit_summary of a fit to self.fit_summaries[method][n_clusters]"""
+        self.fit_summaries.setdefault(method, {}).setdefault(n_clusters, []).append(summary)
+
+    def best_model(self, method = None):
+        """The fit with the best ICL among self.best_fits, over all the numbers of clusters, without running any EM
+
+        Args:
+            method (str, optional): only look at the fits of this initialisation method. Defaults to None, for all of them.
+
+        Returns:
+            dict: the results entry of the fit
+        """
+        methods = list(self.best_fits.keys()) if method is None else [method]
+        candidates = [fits[0] for method in methods for fits in self.best_fits[method].values() if len(fits) > 0]
+        return max(candidates, key=lambda entry : entry['ICL'])
+
+    def open_checkpoint(self, checkpoint_path, checkpoint_interval):
+        """Start recording the jobs in the Checkpoint of checkpoint_path (nothing if it is None), 
+        and continue the random generators from where its last write left them"""
+        if checkpoint_path is None:
+            return
+        self.checkpoint = Checkpoint(checkpoint_path, checkpoint_interval)
+        if self.checkpoint.rng_state is not None:
+            set_rng_state(self.checkpoint.rng_state)
+
+    def close_checkpoint(self):
+        """Write the pending jobs of the checkpoint and stop recording"""
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+        self.checkpoint = None
+
+    def resume_job(self, job):
+        """If the checkpoint holds the job (method, n_clusters, restart), put its result in self.results and return True"""
+        if self.checkpoint is None or job not in self.checkpoint:
+            return False
+        self.results[job[1]] = self.checkpoint.get(job)
+        return True
+
+    def finish_job(self, job):
+        """Record the result of the job (method, n_clusters, restart), taken from self.results, in the checkpoint"""
+        if self.checkpoint is not None:
+            self.checkpoint.add(job, self.results[job[1]], rng_state = rng_state())
+
+    def precomputed(self, n_clusters, initilisation_method, restart = None):
+        """The initialisation_precomputed of initilisation_method, read from self.init_cache (None for 'random' and 'warm_start').
+        The spectral eigenvectors are computed for the largest number of clusters asked so far, the smaller ones use a prefix of them. 
+        A restart of precise_fit gets its own entry when the method needs one to differ from the other restarts (see restart_params)"""
+        return self.init_cache.precomputed(self.sparse_graph, n_clusters, initilisation_method, **restart_params(initilisation_method, restart))
+
+    def restart_precomputed(self, n_clusters, n_restarts, initilisation_method):
+        """The initialisation_precomputed of the n_restarts restarts of main_batched: one per restart when the method needs one 
+        to differ from the other restarts (see restart_params), else the one shared by all of them"""
+        if restart_params(initilisation_method, 0):
+            return [self.precomputed(n_clusters, initilisation_method, r) for r in range(n_restarts)]
+        return self.precomputed(n_clusters, initilisation_method)
+
+    def add_callback(self, callback):
+        """Call callback with the event of each EM iteration of the next fits (see iteration_event)"""
+        self.callbacks.append(callback)
+
+    def expected_peak_bytes(self, n_clusters):
+        """The peak memory, in bytes, expected by the dense kernels for n_clusters clusters with the max_memory_bytes budget (None without budget)"""
+        if self.max_memory_bytes is None:
+            return None
+        return dense_tile_rows(self.sparse_graph.number_of_nodes(), n_clusters, self.max_memory_bytes)[1]
         
-    def fit(self, tab_n_clusters = [2,3,4,5,6,7,8], n_clusters = None, max_iter = None, initilisation_method = None, save_path = "save_results", print_fit_finish = True):
+    def EM_restarts(self, n_clusters, n_restarts, max_iter = None, initilisation_method = None, top_k = 1, precomputed = None):
+        """Run n_restarts EM algorithms at once (see main_batched) and keep the one with the best ICL in self.results. 
+        The top_k best restarts are also offered to self.best_fits, and the summary of every restart is added to self.fit_summaries. 
+        The callbacks get the events of every restart (see main_batched), and the 'trace' of a TraceRecorder holds them all in the kept entry. 
+        With self.store, every restart is appended to it with its 'restart' number, the best one last (so that it is the one of ResultsStore.latest)
+
+        Args:
+            n_clusters (int): the number of clusters
+            n_restarts (int): the number of initialisations
+            max_iter (int, optional): The number of iterations for the EM algorithm. Defaults to self.max_iter.
+            initilisation_method (str, optional): The initialisation method you want to use. Defaults to self.initilisation_method.
+            top_k (int, optional): the number of fits kept in self.best_fits for (initilisation_method, n_clusters). Defaults to 1.
+            precomputed (optional): the initialisation_precomputed given to main_batched, e.g. the restart_precomputed of a sweep over 
+            several numbers of clusters. Defaults to the one of self.init_cache.
+
+        Returns:
+            list: the ICL of every restart
+        """
+        if max_iter == None:
+            max_iter = self.max_iter
+        if initilisation_method == None:
+            initilisation_method = self.initilisation_method
+        if precomputed is None:
+            precomputed = self.restart_precomputed(n_clusters, n_restarts, initilisation_method)
+        priors, pi, tau, tab_jrx, info = main_batched(self.sparse_graph, n_clusters, n_restarts, max_iter = max_iter, method = initilisation_method, 
+                                                      precomputed = precomputed, callbacks = self.callbacks, **self.tolerances)
+        ICL_restarts = ICL_batched(self.sparse_graph, tau, pi, priors)
+        def restart_entry(r):
+            return {'pi': pi[r].to('cpu').numpy(), 'tau' : tau[r].to('cpu').numpy(), 'jrx' : tab_jrx[r], 'priors' : priors[r].to('cpu').numpy(), 'ICL' : ICL_restarts[r], 'max_iter' : max_iter, 'initialisation' : initilisation_method, 'n_clusters' : n_clusters,
+                    'n_iter' : info['n_iter'][r], 'n_iter_tau' : info['n_iter_tau'][r], 'converged' : info['converged'][r], 'restart' : r}
+        summaries = [fit_summary({'ICL' : ICL_restarts[r], 'jrx' : tab_jrx[r], 'n_iter' : info['n_iter'][r], 'converged' : info['converged'][r]}, r) for r in range(n_restarts)]
+        order = [int(r) for r in np.argsort(-ICL_restarts)]
+        for r in order[:top_k]:
+            self.keep_best_fit(initilisation_method, n_clusters, restart_entry(r), top_k)
+        for summary in summaries:
+            self.add_fit_summary(initilisation_method, n_clusters, summary)
+        if self.store is not None:
+            for r in range(n_restarts):
+                if r != order[0]:
+                    self.store.append(restart_entry(r))
+        best = restart_entry(order[0])
+        best['ICL_restarts'] = ICL_restarts.tolist()
+        best['restarts'] = summaries
+        end_fit(self.callbacks, best)
+        self.set_result(n_clusters, best)
+        return ICL_restarts.tolist()
+
+    def EM_online(self, n_clusters, batch_size = 1000, max_iter = 1000, initilisation_method = None, **kwargs):
+        """Fit the model with the stochastic variational EM of main_online, whose iterations cost does not depend on the number of nodes
+
+        Args:
+            n_clusters (int): the number of clusters
+            batch_size (int, optional): the number of nodes sampled at each iteration. Defaults to 1000.
+            max_iter (int, optional): maximum number of iterations. Defaults to 1000.
+            initilisation_method (str, optional): The initialisation method you want to use. Defaults to self.initilisation_method.
+            **kwargs: the other parameters of main_online (step_offset, step_decay, n_holdout, eval_every, seed)
+        """
+        if initilisation_method == None:
+            initilisation_method = self.initilisation_method
+        kwargs.setdefault('rtol', self.tolerances['rtol'])
+        kwargs.setdefault('atol', self.tolerances['atol'])
+        priors, pi, tau, tab_jrx, info = main_online(self.sparse_graph, n_clusters, batch_size = batch_size, max_iter = max_iter, method = initilisation_method, 
+                                                     callbacks = self.callbacks, **kwargs)
+        ICL_clusters = ICL_sparse(self.sparse_graph, tau, pi, priors)
+        result = {'pi': pi.to('cpu').numpy(), 'tau' : tau.to('cpu').numpy(), 'jrx' : tab_jrx, 'priors' : priors.to('cpu').numpy(), 'ICL' : ICL_clusters, 'max_iter' : max_iter, 'initialisation' : initilisation_method, 'n_clusters' : n_clusters,
+                  'n_iter' : info['n_iter'], 'converged' : info['converged'], 'online' : True, 'batch_size' : batch_size}
+        end_fit(self.callbacks, result)
+        self.set_result(n_clusters, result)
+
+    def fit(self, tab_n_clusters = [2,3,4,5,6,7,8], n_clusters = None, max_iter = None, initilisation_method = None, save_path = "save_results", print_fit_finish = True, n_jobs = 1, warm_start = False, 
+            checkpoint_path = None, checkpoint_interval = 1):
         """This function will fit the EM algorithm to your graph
 
         Args:
@@ -290,23 +1721,116 @@ class mixtureModel():
             n_clusters (int, optional): The number of clusters for which you want to perform your fit
             max_iter (int, optional): The number of iterations for the EM algorithm. Defaults to 50.
             initilisation_method (str, optional): The initialisation method you want to use. Defaults to 'spectral'.
-            save_path (str, optional): the folder in which you want to save the results. Defaults to "save_results".
+            save_path (str, optional): the folder of the ResultsStore to which every fit of this call is appended as soon as it finishes 
+            (self.store during the call), None to keep the results in memory only. Defaults to "save_results".
             print_fit_finish (bool, optional): print "fit finished' after each fit for a certain number of clusters. Defaults to True.
+            n_jobs (int, optional): the number of processes among which the values of tab_n_clusters are shared, -1 to use all the cores. 
+            The workers are spawned, so a script using n_jobs > 1 needs an `if __name__ == '__main__':` guard. 
+            With max_memory_bytes, each worker has its own budget. The callbacks are called in the workers, on copies: 
+            a TraceRecorder still fills the 'trace' of the results and its JSONL file, but not its events list. Defaults to 1.
+            warm_start (bool, optional): only the smallest number of clusters is initialised with initilisation_method, 
+            every other fit starts from the previous one where a cluster has been split (see split_cluster_tau). Defaults to False.
+            checkpoint_path (str, optional): the folder of a Checkpoint recording every finished number of clusters. Running the same fit 
+            again with it skips them (their results are read back) and continues the random generators. Defaults to None.
+            checkpoint_interval (int, optional): the number of fits between two writes of the checkpoint. Defaults to 1.
         """
         if max_iter == None:
             max_iter = self.max_iter
         if initilisation_method == None:
             initilisation_method = self.initilisation_method
-        if n_clusters == None:
-            for n_cluster in tab_n_clusters:
-                self.EM(n_cluster, max_iter, initilisation_method)
-                if print_fit_finish:
-                    print('Fit finished for ', n_cluster, ' clusters ')
-        else :
-            self.EM(n_clusters, max_iter, initilisation_method)
-        with open(save_path+'.pkl', 'wb') as f:
-            pickle.dump(self.results, f)
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        if n_clusters != None:
+            tab_n_clusters = [n_clusters]
+        previous_store, self.store = self.store, None if save_path is None else ResultsStore(save_path)
+        self.open_checkpoint(checkpoint_path, checkpoint_interval)
+        try:
+            if warm_start:
+                self.warm_start_fit(tab_n_clusters, max_iter, initilisation_method, print_fit_finish)
+                return
+            todo = [n_cluster for n_cluster in tab_n_clusters if not self.resume_job((initilisation_method, n_cluster, None))]
+            if len(todo) > 0:
+                # the expensive part of the initialisation is computed once for the whole sweep
+                self.precomputed(max(todo), initilisation_method)
+            if n_jobs > 1:
+                self.parallel_fit(todo, max_iter, initilisation_method, n_jobs, print_fit_finish)
+            else:
+                for n_cluster in todo:
+                    self.EM(n_cluster, max_iter, initilisation_method)
+                    self.finish_job((initilisation_method, n_cluster, None))
+                    if print_fit_finish:
+                        print('Fit finished for ', n_cluster, ' clusters ')
+        finally:
+            self.close_checkpoint()
+            self.store = previous_store
             
+    def warm_start_fit(self, tab_n_clusters, max_iter, initilisation_method, print_fit_finish = True):
+        """Fit the numbers of clusters in increasing order, each fit being initialised by splitting 
+        clusters of the previous one until the number of clusters is reached
+
+        Args:
+            tab_n_clusters (list): the numbers of clusters to fit
+            max_iter (int): The number of iterations for the EM algorithm
+            initilisation_method (str): The initialisation method of the first (smallest) fit
+            print_fit_finish (bool, optional): print "fit finished' after each fit. Defaults to True.
+        """
+        sparse_edges = get_sparse_X(self.sparse_graph)
+        previous_n_clusters = None
+        for n_cluster in sorted(tab_n_clusters):
+            if self.resume_job((initilisation_method, n_cluster, None)):
+                pass
+            elif previous_n_clusters is None:
+                self.EM(n_cluster, max_iter, initilisation_method)
+                self.finish_job((initilisation_method, n_cluster, None))
+            else:
+                tau = torch.from_numpy(np.asarray(self.results[previous_n_clusters]['tau'], dtype=np.float64)).to(sparse_edges.device)
+                while tau.shape[1] < n_cluster:
+                    tau = split_cluster_tau(sparse_edges, tau)
+                result = run_EM(self.sparse_graph, n_cluster, max_iter, 'warm_start', self.tolerances, tau_init = tau.to('cpu').numpy(), 
+                                max_memory_bytes = self.max_memory_bytes, callbacks = self.callbacks, tau_top_k = self.tau_top_k)
+                result['warm_start_from'] = previous_n_clusters
+                self.set_result(n_cluster, result)
+                self.finish_job((initilisation_method, n_cluster, None))
+            previous_n_clusters = n_cluster
+            if print_fit_finish:
+                print('Fit finished for ', n_cluster, ' clusters ')
+
+    def parallel_fit(self, tab_n_clusters, max_iter, initilisation_method, n_jobs, print_fit_finish = True):
+        """Run the EM for all the values of tab_n_clusters in a pool of n_jobs processes.
+        The adjacency is put once in shared memory and every worker attaches to it, 
+        and the torch threads are split between the workers so that they do not oversubscribe the CPU.
+
+        Args:
+            tab_n_clusters (list): the numbers of clusters to fit
+            max_iter (int): The number of iterations for the EM algorithm
+            initilisation_method (str): The initialisation method you want to use
+            n_jobs (int): the number of processes
+            print_fit_finish (bool, optional): print "fit finished' after each fit. Defaults to True.
+        """
+        adjacency = self.sparse_graph
+        shared_arrays = [share_array(np.asarray(array)) for array in (adjacency.indptr, adjacency.indices, adjacency.data)]
+        n_threads = max(1, os.cpu_count() // n_jobs)
+        results = {}
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=get_context('spawn'), initializer=init_EM_worker,
+                                     initargs=([description for _, description in shared_arrays], adjacency.shape, n_threads)) as executor:
+                futures = {executor.submit(EM_worker, n_cluster, max_iter, initilisation_method, self.tolerances, self.max_memory_bytes, self.callbacks, 
+                                           self.precomputed(n_cluster, initilisation_method), self.tau_top_k) : n_cluster for n_cluster in tab_n_clusters}
+                for future in as_completed(futures):
+                    results[futures[future]] = self.compact(future.result())
+                    self.set_result(futures[future], results[futures[future]])
+                    self.finish_job((initilisation_method, futures[future], None))
+                    if print_fit_finish:
+                        print('Fit finished for ', futures[future], ' clusters ')
+        finally:
+            for shm, _ in shared_arrays:
+                shm.close()
+                shm.unlink()
+        # in the order of tab_n_clusters rather than of completion
+        for n_cluster in tab_n_clusters:
+            self.results.pop(n_cluster)
+            self.results[n_cluster] = results[n_cluster]
+
     def plot_jrx_several_plot(self, tab_n_clusters):
         """_summary_
 
@@ -360,19 +1884,19 @@ class mixtureModel():
             show_names (bool, optional): Plot the names of the nodes in the adjency matrix. Defaults to False.
         """
         # Get the node estimated distribition
-        z = from_tau_to_Z(torch.from_numpy(self.results[n_clusters]['tau']))
-        cluster_indices = {q: np.where(z[:, q] == 1)[0] for q in range(n_clusters)}
+        labels = tau_labels(self.results[n_clusters]['tau'])
+        cluster_indices = {q: np.where(labels == q)[0] for q in range(n_clusters)}
         
         # Permutation of the adjency matrix
-        adjacency_matrix = nx.to_numpy_array(self.graph)
+        adjacency_matrix = self.sparse_graph.to_scipy()
         new_order = np.concatenate([cluster_indices[q] for q in range(n_clusters)])
-        permuted_matrix = adjacency_matrix[np.ix_(new_order, new_order)]
+        permuted_matrix = adjacency_matrix[new_order][:, new_order]
         
         plt.figure(figsize=(6, 6))
         plt.spy(permuted_matrix, markersize=0.5)
         
         if show_names:
-            names_index = [(index, name) for index, name in enumerate(self.graph.nodes())]
+            names_index = [(index, name) for index, name in enumerate(self.node_labels())]
             index_to_name = dict(names_index)
             labels = [index_to_name[index] for index in new_order]
             plt.xticks(ticks=np.arange(len(labels)), labels=labels, rotation=90, fontsize=6)  # Rotate for better legibility
@@ -407,12 +1931,23 @@ class mixtureModel():
             else:
                 self.plot_adjency_matrix(n_clusters, save_path = None, show_names = show_names)
         
+    def node_labels(self):
+        """The label of each node of the graph, in the order of the rows of tau"""
+        if self.sparse_graph.node_labels is None:
+            return list(range(self.sparse_graph.number_of_nodes()))
+        return self.sparse_graph.node_labels
+
     def load_results(self, results_path):
-        """Load the results from a pkl file of a previous model
+        """Load the results of a previous model, from the folder of its ResultsStore or from a pkl file of the older versions.
+        From a folder, self.results holds the last fit of every number of clusters as a StoredResult, whose tau and pi 
+        are only read when they are accessed (use ResultsStore(results_path).index() to list all the stored fits)
 
         Args:
-            results_path (str): where to find the pkl file
+            results_path (str): the folder of the store, or the pkl file
         """
+        if os.path.isdir(results_path):
+            self.results = ResultsStore(results_path).latest()
+            return
         with open(results_path, 'rb') as f:
             self.results = pickle.load(f)
 
@@ -425,38 +1960,90 @@ class mixtureModel():
         Returns:
             dic: a dictionnary with the nodes in each classes
         """
-        z = from_tau_to_Z(torch.from_numpy(self.results[n_clusters]['tau']))
-        nodes_index=[(index, node) for index, node in enumerate(self.graph.nodes())]
-        cluster_indices = {q: np.where(z[:, q] == 1)[0] for q in range(n_clusters)}
+        labels = tau_labels(self.results[n_clusters]['tau'])
+        nodes_index=[(index, node) for index, node in enumerate(self.node_labels())]
+        cluster_indices = {q: np.where(labels == q)[0] for q in range(n_clusters)}
         clusters={}
         for q, indices in cluster_indices.items():
             clusters[q] = [item[1] for item in nodes_index if item[0] in indices] 
         return clusters
     
-    def precise_fit_one_method(self, list_clusters, nbr_iter_per_cluster = 20, max_iter_em = 50, initialisation_method = 'random'):
+    def precise_fit_one_method(self, list_clusters, nbr_iter_per_cluster = 20, max_iter_em = 50, initialisation_method = 'random', batched = True, top_k = 1):
         ICL_values_method = {}
         for n_cluster in list_clusters:
                 ICL_values_method[n_cluster] = []
-        for _ in range(nbr_iter_per_cluster):
-            self.fit(tab_n_clusters=list_clusters, max_iter=max_iter_em, initilisation_method=initialisation_method, print_fit_finish=False)
+        self.best_fits[initialisation_method] = {}
+        self.fit_summaries[initialisation_method] = {}
+        n_restarts = nbr_iter_per_cluster
+        if initialisation_method in DETERMINISTIC_METHODS and n_restarts > 1:
+            warnings.warn(f"The '{initialisation_method}' initialisation is deterministic, its {n_restarts} restarts are replaced by a single fit")
+            n_restarts = 1
+        if not restart_params(initialisation_method, 0):
+            self.precomputed(max(list_clusters), initialisation_method)
+        if batched:
+            # computed once for all the numbers of clusters, the restarts of each of them would not fit in self.init_cache
+            precomputed = None
             for n_cluster in list_clusters:
-                ICL_values_method[n_cluster].append(self.results[n_cluster]['ICL'])
+                job = (initialisation_method, n_cluster, None)
+                if self.resume_job(job):
+                    # the checkpoint only holds the best restart
+                    self.keep_best_fit(initialisation_method, n_cluster, self.results[n_cluster], top_k)
+                    for summary in self.results[n_cluster]['restarts']:
+                        self.add_fit_summary(initialisation_method, n_cluster, summary)
+                else:
+                    if precomputed is None:
+                        precomputed = self.restart_precomputed(max(list_clusters), n_restarts, initialisation_method)
+                    self.EM_restarts(n_cluster, n_restarts, max_iter = max_iter_em, initilisation_method = initialisation_method, top_k = top_k, 
+                                     precomputed = precomputed)
+                    self.finish_job(job)
+                ICL_values_method[n_cluster] = list(self.results[n_cluster]['ICL_restarts'])
+        else:
+            for restart in range(n_restarts):
+                for n_cluster in list_clusters:
+                    job = (initialisation_method, n_cluster, restart)
+                    if not self.resume_job(job):
+                        self.EM(n_cluster, max_iter_em, initialisation_method, restart = restart)
+                        self.finish_job(job)
+                    self.keep_best_fit(initialisation_method, n_cluster, self.results[n_cluster], top_k)
+                    self.add_fit_summary(initialisation_method, n_cluster, fit_summary(self.results[n_cluster], restart))
+                    ICL_values_method[n_cluster].append(self.results[n_cluster]['ICL'])
         self.ICL_values[initialisation_method] = ICL_values_method
         self.parameters = {}
         self.parameters['nbr_iter_per_cluster'] = nbr_iter_per_cluster
         self.parameters['max_iter_em'] = max_iter_em
         
-    def precise_fit(self, list_clusters, nbr_iter_per_cluster = 20, max_iter_em = 50, list_initialisation_methods = ['random']):
+    def precise_fit(self, list_clusters, nbr_iter_per_cluster = 20, max_iter_em = 50, list_initialisation_methods = ['random'], batched = True, save_path = None, 
+                    checkpoint_path = None, checkpoint_interval = 1, top_k = 1):
         """Fit the model several times on several initialisation methods
 
         Args:
             list_clusters (list): the list of clusters you want to use for your fit
-            nbr_iter_per_cluster (int, optional): the number of time you perform the EM per cluster. Defaults to 20.
+            nbr_iter_per_cluster (int, optional): the number of time you perform the EM per cluster. Defaults to 20. 
+            Every 'modularity' restart starts from its own Louvain hierarchy, and the deterministic 'hierarchical' initialisation is fitted once.
             max_iter_em (int, optional): the max_iter for each EM algorithm. Defaults to 50.
             list_initialisation_methods (list, optional): the list of initialisation method you want to use. Defaults to ['random'].
+            batched (bool, optional): run the nbr_iter_per_cluster restarts of each number of clusters as one batched EM (see EM_restarts). 
+            Otherwise the EM is run once per restart. Defaults to True.
+            save_path (str, optional): the folder of a ResultsStore to which every fit of this call is appended as soon as it finishes, 
+            None to keep the results in memory only. Defaults to None.
+            checkpoint_path (str, optional): the folder of a Checkpoint recording every finished job (method, number of clusters, restart), 
+            all the restarts of a number of clusters being one job when batched. Running the same precise_fit again with it 
+            skips the finished jobs and continues the random generators. Defaults to None.
+            checkpoint_interval (int, optional): the number of jobs between two writes of the checkpoint. Defaults to 1.
+            top_k (int, optional): the number of fits (tau, pi, priors, ICL, ...) with the best ICL kept in self.best_fits[method][n_clusters] 
+            as the restarts finish, self.fit_summaries[method][n_clusters] holding the fit_summary of every restart. 
+            self.results[n_clusters] is then the best fit over all the methods, and best_model() the best one overall. Defaults to 1.
         """
-        for method in list_initialisation_methods:
-            self.precise_fit_one_method(list_clusters, nbr_iter_per_cluster = nbr_iter_per_cluster, max_iter_em = max_iter_em, initialisation_method=method)
+        previous_store, self.store = self.store, None if save_path is None else ResultsStore(save_path)
+        self.open_checkpoint(checkpoint_path, checkpoint_interval)
+        try:
+            for method in list_initialisation_methods:
+                self.precise_fit_one_method(list_clusters, nbr_iter_per_cluster = nbr_iter_per_cluster, max_iter_em = max_iter_em, initialisation_method=method, batched = batched, top_k = top_k)
+        finally:
+            self.close_checkpoint()
+            self.store = previous_store
+        for n_cluster in list_clusters:
+            self.results[n_cluster] = max((self.best_fits[method][n_cluster][0] for method in list_initialisation_methods), key=lambda entry : entry['ICL'])
                 
     def plot_repeated_ICL(self, list_methods = None, save_path = None):
         """Plot the ICL after a precise fit, with the confidence value of each result
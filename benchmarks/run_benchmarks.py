@@ -0,0 +1,219 @@
+"""Benchmarks of the EM kernels, of the initialisation methods and of mixtureModel.fit
+
+Every case (benchmark, implementation, n, Q, density) runs in its own forked process, on a SBM graph sampled
+with generator.generate_sbm, and reports its best time over --repeat runs and its peak memory (increase of
+the maximum resident set size during the runs). The kernels are timed for the sparse torch version used by
+the EM, the dense torch version and the numpy version of old/em.py. The dense versions are skipped when
+their (n, n, Q, Q) tensors would not fit in --max-dense-bytes.
+
+Usage:
+    python benchmarks/run_benchmarks.py                         # default grid, saved in benchmarks/results
+    python benchmarks/run_benchmarks.py --n 500 2000 --Q 5 --density 0.05 --benchmarks appro_tau fit
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import multiprocessing
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generator import generate_sbm
+
+KERNELS = ['return_priors_pi', 'appro_tau', 'J_R_x', 'ICL']
+INITIALISATIONS = ['spectral', 'hierarchical', 'modularity']
+BENCHMARKS = KERNELS + ['init_' + method for method in INITIALISATIONS] + ['fit']
+IMPLEMENTATIONS = ['torch_sparse', 'torch_dense', 'numpy']
+
+def sbm_parameters(n_clusters, density):
+    """pi and priors of an assortative SBM with uniform priors and an expected edge density of density"""
+    pi = np.full((n_clusters, n_clusters), density / 2)
+    pi[np.diag_indices(n_clusters)] += density * n_clusters / 2
+    return np.minimum(pi, 1), np.full(n_clusters, 1 / n_clusters)
+
+def peak_rss_bytes():
+    """The maximum resident set size of the process (ru_maxrss is in kilobytes on Linux, in bytes on macOS)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def load_old_em():
+    """The numpy implementation of old/em.py, as a module"""
+    spec = importlib.util.spec_from_file_location('old_em', os.path.join(ROOT, 'old', 'em.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def prepare(case, adjacency, parameters):
+    """Build the inputs of the case and return the function to time. The kernels get the (pi, priors) parameters 
+    of the SBM that generated adjacency, so that no kernel runs before the peak memory baseline of run_case is read"""
+    import torch
+    import EM_torch
+    from sparse_graph import SparseGraph
+
+    n_nodes, n_clusters = case['n'], case['Q']
+    graph = SparseGraph.from_scipy(adjacency)
+    benchmark = case['benchmark']
+
+    if benchmark.startswith('init_'):
+        method = benchmark[len('init_'):]
+        return lambda : EM_torch.initialise_tau(graph, n_clusters, method)
+
+    if benchmark == 'fit':
+        save_path = os.path.join(tempfile.mkdtemp(), 'results')
+        def fit():
+            model = EM_torch.mixtureModel(graph, initilisation_method='spectral')
+            model.fit([n_clusters], save_path=save_path, print_fit_finish=False)
+        return fit
+
+    rng = np.random.default_rng(case['seed'])
+    tau = rng.dirichlet(np.ones(n_clusters), size=n_nodes)
+    pi, priors = parameters
+    implementation = case['implementation']
+    if implementation == 'numpy':
+        old_em = load_old_em()
+        X = adjacency.toarray()
+        kernels = {'return_priors_pi' : lambda : old_em.return_priors_pi(X, tau),
+                   'appro_tau' : lambda : old_em.appro_tau(tau, X, pi, priors),
+                   'J_R_x' : lambda : old_em.J_R_x(X, tau, pi, priors),
+                   'ICL' : lambda : old_em.ICL(X, tau, pi, priors)}
+        return kernels[benchmark]
+
+    tau = torch.from_numpy(tau)
+    pi, priors = torch.from_numpy(pi), torch.from_numpy(priors)
+    if implementation == 'torch_dense':
+        X = torch.from_numpy(adjacency.toarray())
+        kernels = {'return_priors_pi' : lambda : EM_torch.return_priors_pi(X, tau),
+                   'appro_tau' : lambda : EM_torch.appro_tau(tau, X, pi, priors),
+                   'J_R_x' : lambda : EM_torch.J_R_x(X, tau, pi, priors),
+                   'ICL' : lambda : EM_torch.ICL(X, tau, pi, priors)}
+    else:
+        X = graph.to_torch(device='cpu')
+        kernels = {'return_priors_pi' : lambda : EM_torch.return_priors_pi_sparse(X, tau),
+                   'appro_tau' : lambda : EM_torch.appro_tau_sparse(tau, X, pi, priors),
+                   'J_R_x' : lambda : EM_torch.J_R_x_sparse(X, tau, pi, priors),
+                   'ICL' : lambda : EM_torch.ICL_sparse(X, tau, pi, priors)}
+    return kernels[benchmark]
+
+def run_case(case, adjacency, parameters, queue):
+    """Time one case in the current (forked) process and put its result in the queue"""
+    try:
+        function = prepare(case, adjacency, parameters)
+        rss_before = peak_rss_bytes()
+        times = []
+        for _ in range(case['repeat']):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        queue.put({'status' : 'ok', 'times' : times, 'best_time' : min(times), 'peak_memory_bytes' : peak_rss_bytes() - rss_before})
+    except Exception as error:
+        queue.put({'status' : 'error', 'error' : repr(error)})
+
+def run_in_process(case, adjacency, parameters, timeout):
+    """Run a case in a child process, so that its peak memory and a crash or timeout only concern it"""
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(case, adjacency, parameters, queue))
+    process.start()
+    try:
+        result = queue.get(timeout=timeout)
+    except Exception:
+        result = {'status' : 'timeout'}
+    process.join(1)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    elif result['status'] == 'timeout' and process.exitcode != 0:
+        result = {'status' : 'crashed', 'exitcode' : process.exitcode}
+    return result
+
+def cases_of(benchmark, implementations):
+    return implementations if benchmark in KERNELS else ['torch_sparse']
+
+def run_benchmarks(args):
+    results = []
+    for n_nodes in args.n:
+        for n_clusters in args.Q:
+            for density in args.density:
+                pi, priors = sbm_parameters(n_clusters, density)
+                adjacency, _ = generate_sbm(n_nodes, pi, priors, seed=args.seed, output='csr')
+                for benchmark in args.benchmarks:
+                    for implementation in cases_of(benchmark, args.implementations):
+                        case = {'benchmark' : benchmark, 'implementation' : implementation, 'n' : n_nodes, 'Q' : n_clusters,
+                                'density' : density, 'n_edges' : int(adjacency.nnz // 2), 'seed' : args.seed, 'repeat' : args.repeat}
+                        if implementation != 'torch_sparse' and 4 * n_nodes**2 * n_clusters**2 * 8 > args.max_dense_bytes:
+                            result = {'status' : 'skipped'}
+                        else:
+                            result = run_in_process(case, adjacency, (pi, priors), args.timeout)
+                        case.update(result)
+                        results.append(case)
+                        print(f"{benchmark:18s} {implementation:13s} n={n_nodes:<7d} Q={n_clusters:<3d} density={density:<6g} "
+                              + (f"{case['best_time']:.4f} s  {case['peak_memory_bytes'] / 2**20:.1f} MB" if case['status'] == 'ok' else case['status']), flush=True)
+    return results
+
+def environment():
+    import torch
+    import scipy
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'date' : datetime.datetime.now().isoformat(timespec='seconds'), 'commit' : commit, 'python' : platform.python_version(),
+            'numpy' : np.__version__, 'scipy' : scipy.__version__, 'torch' : torch.__version__, 'platform' : platform.platform(),
+            'cpu_count' : os.cpu_count(), 'torch_threads' : torch.get_num_threads()}
+
+def compare(old_path, new_path):
+    """Print the ratio of the times and of the peak memories of two result files, for the cases both ran"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    key = lambda case : (case['benchmark'], case['implementation'], case['n'], case['Q'], case['density'])
+    old_cases = {key(case) : case for case in old['results'] if case['status'] == 'ok'}
+    print(f"{'benchmark':18s} {'implementation':13s} {'n':>7s} {'Q':>3s} {'density':>7s} {'time new/old':>12s} {'memory new/old':>14s}")
+    for case in new['results']:
+        if case['status'] != 'ok' or key(case) not in old_cases:
+            continue
+        old_case = old_cases[key(case)]
+        memory_ratio = case['peak_memory_bytes'] / old_case['peak_memory_bytes'] if old_case['peak_memory_bytes'] > 0 else float('nan')
+        print(f"{case['benchmark']:18s} {case['implementation']:13s} {case['n']:7d} {case['Q']:3d} {case['density']:7g} "
+              f"{case['best_time'] / old_case['best_time']:12.2f} {memory_ratio:14.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, nargs='+', default=[100, 500, 2000, 10000], help='numbers of vertices')
+    parser.add_argument('--Q', type=int, nargs='+', default=[2, 5, 10], help='numbers of clusters')
+    parser.add_argument('--density', type=float, nargs='+', default=[0.01, 0.1], help='expected edge densities')
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument('--implementations', nargs='+', default=IMPLEMENTATIONS, choices=IMPLEMENTATIONS, help='implementations of the kernels')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best time is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600, help='seconds after which a case is stopped')
+    parser.add_argument('--max-dense-bytes', type=float, default=2**31, help='skip the dense kernels needing more memory')
+    parser.add_argument('--output', default=None, help='JSON file of the results. Defaults to benchmarks/results/benchmark_<date>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    cases = run_benchmarks(args)
+    results = {'environment' : environment(), 'arguments' : vars(args), 'results' : cases}
+    output = args.output
+    if output is None:
+        output = os.path.join(ROOT, 'benchmarks', 'results', f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Results saved in', output)
@@ -1,42 +1,189 @@
-import numpy as np 
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
-import random
+import json
+import os
 
-def generate(n_vertices, pi, priors):
+from scipy.sparse import coo_array
+
+def get_rng(seed = None):
+    """The numpy.random.Generator to sample with
+
+    Args:
+        seed (int or np.random.Generator, optional): a Generator is used as it is, an int seeds a new one.
+        Defaults to None, a new Generator seeded from np.random, so that np.random.seed still makes the graphs reproducible.
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if seed is None:
+        seed = np.random.randint(2**31)
+    return np.random.default_rng(seed)
+
+def triangle_pairs(index, n):
+    """The pair (i, j), i < j, of each index of the strict upper triangle of a n x n matrix, in row order"""
+    index = np.asarray(index, dtype=np.int64)
+    i = n - 2 - np.floor(np.sqrt(-8 * index + 4 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+    j = index + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+    return i, j
+
+def triangle_offset(row, n):
+    """The number of pairs (i, j), i < j, of the strict upper triangle of a n x n matrix before the row"""
+    return row * (n - 1) - row * (row - 1) // 2
+
+def iter_sbm_edges(vertices_clusters, pi, seed = None, max_pairs = 2**26):
+    """Sample the edges of a SBM block pair by block pair and yield them by chunks: each chunk covers some rows of a block
+    with at most max_pairs pairs of vertices, its number of edges is drawn from a binomial, then their positions among the pairs 
+    of the chunk without replacement. Only the sampled edges are in memory, never the pairs.
+
+    Args:
+        vertices_clusters (np.array): the cluster of each vertex
+        pi (np.array): the probability of a link between two clusters, of size (n_clusters, n_clusters)
+        seed (int or np.random.Generator, optional): see get_rng. Defaults to None.
+        max_pairs (int, optional): the maximum number of pairs of vertices covered by a chunk. Defaults to 2**26.
+
+    Yields:
+        np.array: edges of size (n_edges, 2), each undirected edge listed once with the smallest vertex first
+    """
+    rng = get_rng(seed)
+    vertices_clusters = np.asarray(vertices_clusters)
+    pi = np.asarray(pi)
+    members = [np.flatnonzero(vertices_clusters == q) for q in range(len(pi))]
+
+    for q in range(len(pi)):
+        for l in range(q, len(pi)):
+            size_q, size_l = len(members[q]), len(members[l])
+            if q == l:
+                chunk_rows = max(1, max_pairs // max(size_q - 1, 1))
+            else:
+                chunk_rows = max(1, max_pairs // max(size_l, 1))
+            for a in range(0, size_q, chunk_rows):
+                b = min(a + chunk_rows, size_q)
+                n_pairs = triangle_offset(b, size_q) - triangle_offset(a, size_q) if q == l else (b - a) * size_l
+                n_edges = rng.binomial(n_pairs, pi[q][l]) if n_pairs > 0 else 0
+                if n_edges == 0:
+                    continue
+                index = rng.choice(n_pairs, size=n_edges, replace=False)
+                if q == l:
+                    i, j = triangle_pairs(index + triangle_offset(a, size_q), size_q)
+                    yield np.stack((members[q][i], members[q][j]), axis=1)
+                else:
+                    edges = np.stack((members[q][a + index // size_l], members[l][index % size_l]), axis=1)
+                    yield np.sort(edges, axis=1)
+
+def sample_sbm_edges(vertices_clusters, pi, seed = None):
+    """All the edges of a SBM sampled by iter_sbm_edges, of size (n_edges, 2) and sorted"""
+    edges = list(iter_sbm_edges(vertices_clusters, pi, seed))
+    if len(edges) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    edges = np.concatenate(edges)
+    return edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+
+def generate_sbm(n_vertices, pi, priors, seed = None, output = 'csr'):
+    """Sample a graph from the SBM without any loop over the pairs of vertices
+
+    Args:
+        n_vertices (int): the number of vertices
+        pi (np.array): the probability of a link between two clusters, of size (n_clusters, n_clusters)
+        priors (np.array): the probability of each cluster
+        seed (int or np.random.Generator, optional): see get_rng. Defaults to None.
+        output (str, optional): 'csr' for the symmetric adjacency as a scipy csr_array, 'edges' for the
+        edges as an array of size (n_edges, 2), 'sparse_graph' for a SparseGraph. Defaults to 'csr'.
+
+    Returns:
+        graph, vertices_clusters
+    """
+    rng = get_rng(seed)
+    vertices_clusters = rng.choice(len(priors), size=n_vertices, p=priors)
+    edges = sample_sbm_edges(vertices_clusters, pi, rng)
+
+    if output == 'edges':
+        return edges, vertices_clusters
+    if output == 'sparse_graph':
+        from sparse_graph import SparseGraph
+        return SparseGraph.from_edge_list(edges, n_vertices), vertices_clusters
+    if output == 'csr':
+        rows = np.concatenate((edges[:, 0], edges[:, 1]))
+        cols = np.concatenate((edges[:, 1], edges[:, 0]))
+        adjacency = coo_array((np.ones(len(rows)), (rows, cols)), shape=(n_vertices, n_vertices)).tocsr()
+        adjacency.sort_indices()
+        return adjacency, vertices_clusters
+    raise ValueError(f"output must be 'csr', 'edges' or 'sparse_graph', not {output}")
+
+def to_networkx_graph(edges, n_vertices):
     G=nx.Graph()
     G.add_nodes_from(range(n_vertices))
-    
-    #attribute a cluster to every nodes, with proba alpha_p
-    vertices_clusters=[np.random.choice( np.arange( 0,len(priors) ), p = priors ) for _ in range(n_vertices)]
-    
-    for i in range(n_vertices):
-        for j in range(i+1,n_vertices):
-            proba_link_ij = pi[vertices_clusters[i]][vertices_clusters[j]]
-            if random.random() < proba_link_ij:
-                G.add_edge(i,j)
-    
+    G.add_edges_from(edges.tolist())
     return G
 
-def generate_and_give_tau(n_vertices, pi, priors):
-    G=nx.Graph()
-    G.add_nodes_from(range(n_vertices))
-    
-    #attribute a cluster to every nodes, with proba alpha_p
-    vertices_clusters=[np.random.choice( np.arange( 0,len(priors) ), p = priors ) for _ in range(n_vertices)]
-    
-    for i in range(n_vertices):
-        for j in range(i+1,n_vertices):
-            proba_link_ij = pi[vertices_clusters[i]][vertices_clusters[j]]
-            if random.random() < proba_link_ij:
-                G.add_edge(i,j)
+def generate(n_vertices, pi, priors, seed = None):
+    edges, vertices_clusters = generate_sbm(n_vertices, pi, priors, seed = seed, output = 'edges')
+    return to_networkx_graph(edges, n_vertices)
+
+def generate_and_give_tau(n_vertices, pi, priors, seed = None):
+    edges, vertices_clusters = generate_sbm(n_vertices, pi, priors, seed = seed, output = 'edges')
     tau = format_tau(vertices_clusters, len(priors))
-    return G, tau
+    return to_networkx_graph(edges, n_vertices), tau
 
 def format_tau(vertices_clusters, n_clusters):
     tau = np.zeros((len(vertices_clusters), n_clusters))
-    for i in range(len(vertices_clusters)):
-        tau[i,vertices_clusters[i]] = 1
+    tau[np.arange(len(vertices_clusters)), vertices_clusters] = 1
     return tau
 
-        
\ No newline at end of file
+def write_sbm(path, n_vertices, pi, priors, seed = None, edges_per_shard = 2**24):
+    """Sample a graph from the SBM and stream its edges to disk, for graphs too large to be held in memory.
+    The folder holds the edges as npy shards of int32 pairs (see iter_sbm_edges), the cluster of each vertex in labels.npy 
+    and the parameters in meta.json. Read it back with load_sbm, or SparseGraph.load for the graph alone.
+
+    Args:
+        path (str): the folder, created if needed
+        n_vertices (int): the number of vertices
+        pi (np.array): the probability of a link between two clusters, of size (n_clusters, n_clusters)
+        priors (np.array): the probability of each cluster
+        seed (int or np.random.Generator, optional): see get_rng. Defaults to None.
+        edges_per_shard (int, optional): the number of edges after which a shard is written. Defaults to 2**24.
+
+    Returns:
+        dict: the content of meta.json
+    """
+    rng = get_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    index_dtype = np.int32 if n_vertices < 2**31 else np.int64
+    vertices_clusters = rng.choice(len(priors), size=n_vertices, p=priors).astype(np.int32)
+    np.save(os.path.join(path, 'labels.npy'), vertices_clusters)
+
+    shards = []
+    buffer = []
+    n_edges = 0
+    n_buffered = 0
+    def write_shard():
+        name = f'edges_{len(shards):05d}.npy'
+        np.save(os.path.join(path, name), np.concatenate(buffer).astype(index_dtype))
+        shards.append(name)
+        buffer.clear()
+
+    for edges in iter_sbm_edges(vertices_clusters, pi, rng):
+        buffer.append(edges)
+        n_edges += len(edges)
+        n_buffered += len(edges)
+        if n_buffered >= edges_per_shard:
+            write_shard()
+            n_buffered = 0
+    if len(buffer) > 0:
+        write_shard()
+
+    meta = {'n_nodes' : int(n_vertices), 'n_edges' : int(n_edges), 'shards' : shards, 'labels' : 'labels.npy', 
+            'pi' : np.asarray(pi).tolist(), 'priors' : np.asarray(priors).tolist()}
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+def load_sbm(path):
+    """Read a folder written by write_sbm
+
+    Returns:
+        graph, vertices_clusters: the SparseGraph and the cluster of each vertex
+    """
+    from sparse_graph import SparseGraph
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    return SparseGraph.load(path), np.load(os.path.join(path, meta['labels']))
@@ -1,99 +1,160 @@
 import numpy as np 
+import hashlib
+import heapq
+import os
 import networkx as nx
 import matplotlib.pyplot as plt
 
 
-from scipy.sparse.linalg import eigs
-from scipy.sparse import diags, eye 
+from scipy.sparse.linalg import eigsh, lobpcg
+from scipy.sparse import diags, coo_array, csr_array
+from scipy.sparse.csgraph import connected_components
+from scipy.cluster.hierarchy import linkage
 from random import randint
+from collections import OrderedDict
 from sklearn.cluster import KMeans
 
 import networkx as nx
 import numpy as np
 from networkx.algorithms import community as nx_community
 
+from sparse_graph import SparseGraph
 
+def get_sparse_graph(G):
+    """The initialisation methods accept a networkx graph or a SparseGraph, the vertex i being the i-th node"""
+    if isinstance(G, SparseGraph):
+        return G
+    return SparseGraph.from_networkx(G)
 
-def spectral_clustering(G, k):
+
+def spectral_embedding(G, d, solver = 'auto', seed = None):
     """
-    :type G : networkX graph
-    :type k : int
-    :rtype : dict -> the algorithm must return a dictionary keyed by node to the cluster to which the node belongs
+    Eigenvectors of the d smallest eigenvalues of the symmetric normalised Laplacian L = I - D^-1/2 A D^-1/2, 
+    computed once and cut with tau_from_embedding at any number of clusters up to d.
+    They are the eigenvectors of the d largest eigenvalues of D^-1/2 A D^-1/2, isolated vertices having a zero row.
+
+    :type G : networkX graph or SparseGraph
+    :type d : int
+    :type solver : str -> 'dense' (numpy eigh), 'eigsh' (Lanczos), 'lobpcg' (for very large graphs), 
+    or 'auto' for 'dense' below 500 vertices and 'eigsh' above
+    :type seed : int or np.random.Generator -> the starting vectors of 'eigsh' and 'lobpcg'
+    :rtype : np.array -> the eigenvectors of size (n_vertices, d), by increasing eigenvalue of L
     """
-    A = nx.adjacency_matrix(G)
-    diagonals = [1/G.degree[node] for node in G.nodes()]
-    D_inv = diags(diagonals)
-    L = eye(G.number_of_nodes()) - D_inv @ A
-    # L = nx.laplacian_matrix(G).astype('float')
-    
-    # d = k in general but can be equal to other values
-    val , vec_eigs = eigs(L, k, which='SM')
-    val , vec_eigs = eigs(L, k, which='SR')
-    # for i in range(len(val)+1):
-    #     print(val[i].real)
-    kmeans = KMeans(n_clusters=k)
-    # vec_eigs = vec_eigs.real.T
-    
-    clusters = kmeans.fit_predict(vec_eigs.real)
-    i = 0
-    tau = np.zeros((len(diagonals),k))
-    for node in G.nodes():
-        tau[i, clusters[i]] = 1
-        i += 1
-    
-    return tau
-
-def calculate_distance_matrix(G):
-    A= nx.adjacency_matrix(G).toarray()
-    n_vertices=G.number_of_nodes()
-    distance_matrix = np.zeros((n_vertices, n_vertices))
-
+    graph = get_sparse_graph(G)
+    n_vertices = graph.number_of_nodes()
+    A = graph.to_scipy()
+    degrees = np.asarray(A.sum(axis=1)).ravel()
+    inv_sqrt_degrees = np.zeros(n_vertices)
+    inv_sqrt_degrees[degrees > 0] = 1 / np.sqrt(degrees[degrees > 0])
+    N = diags(inv_sqrt_degrees) @ A @ diags(inv_sqrt_degrees)
+
+    d = min(d, n_vertices)
+    if solver == 'auto':
+        solver = 'dense' if n_vertices < 500 else 'eigsh'
+    if solver == 'eigsh' and d >= n_vertices - 1:
+        solver = 'dense'
+    rng = np.random.default_rng(seed)
+    if solver == 'dense':
+        _, vectors = np.linalg.eigh(N.toarray())
+        vectors = vectors[:, ::-1]
+    elif solver == 'eigsh':
+        values, vectors = eigsh(N, k=d, which='LA', v0=rng.uniform(-1, 1, n_vertices))
+        vectors = vectors[:, np.argsort(-values)]
+    elif solver == 'lobpcg':
+        values, vectors = lobpcg(N, rng.normal(size=(n_vertices, d)), largest=True, tol=1e-5, maxiter=500)
+        vectors = vectors[:, np.argsort(-values)]
+    else:
+        raise ValueError(f"Unknown solver {solver}, expected 'auto', 'dense', 'eigsh' or 'lobpcg'")
+    return vectors[:, :d]
+
+def tau_from_embedding(vectors, n_clusters, seed = None):
+    """
+    K-means on the rows of the first n_clusters eigenvectors of spectral_embedding, normalised to unit length (Ng, Jordan and Weiss)
 
-    for i in range(n_vertices):
-        for j in range(i + 1, n_vertices):
-            A_copy=A.copy()
-            euclidean_matrix = (A_copy - A_copy[i,j])**2
-            distance_matrix[i, j] = distance_matrix[j, i] = np.sqrt(euclidean_matrix.sum(axis=1)-A_copy[i,j]**2)[i]
-    
-    return distance_matrix
+    :type vectors : np.array -> the eigenvectors of size (n_vertices, d), with d >= n_clusters
+    :type n_clusters : int
+    :type seed : int -> the random state of the k-means, None for a new one at every call
+    :rtype : np.array -> tau of size (n_vertices, n_clusters), with a one for the cluster to which each node belongs
+    """
+    n_vertices = len(vectors)
+    embedding = vectors[:, :n_clusters]
+    norms = np.linalg.norm(embedding, axis=1, keepdims=True)
+    embedding = embedding / np.where(norms > 0, norms, 1)
+    clusters = KMeans(n_clusters=n_clusters, n_init=10, random_state=seed).fit_predict(embedding)
+    tau = np.zeros((n_vertices, n_clusters))
+    tau[np.arange(n_vertices), clusters] = 1
+    return tau
 
-def find_closest_clusters(distance_matrix):
-    np.fill_diagonal(distance_matrix, np.inf)
-    return np.unravel_index(np.argmin(distance_matrix, axis=None), distance_matrix.shape)
+def spectral_clustering(G, k):
+    """
+    :type G : networkX graph or SparseGraph
+    :type k : int
+    :rtype : np.array -> tau of size (n_vertices, k), with a one for the cluster to which each node belongs
+    """
+    return tau_from_embedding(spectral_embedding(G, k), k)
 
-def hierarchical_clustering(G, n_clusters):
-    n_vertices = G.number_of_nodes()
-    clusters = [[i] for i in range(n_vertices)]
-    distance_matrix = calculate_distance_matrix(G)
+def calculate_distance_matrix(G, block_rows = 1024):
+    """
+    Euclidean distance between the rows of the adjacency matrix of each pair of vertices (i, j), without the entries i and j:
+    d_ij^2 = sum_{k != i, j} (A_ik - A_jk)^2 = |A_i|^2 + |A_j|^2 - 2 (A A)_ij - 2 A_ij^2, computed by blocks of block_rows rows.
 
-    while len(clusters) > n_clusters:
-        i, j = find_closest_clusters(distance_matrix)
+    :type G : networkX graph or SparseGraph
+    :rtype : np.array -> the condensed distance matrix of size n_vertices * (n_vertices - 1) / 2 (see scipy.spatial.distance.squareform)
+    """
+    graph = get_sparse_graph(G)
+    A = graph.to_scipy()
+    n_vertices = graph.number_of_nodes()
+    squared_norms = np.asarray(A.multiply(A).sum(axis=1)).ravel()
+    distances = np.empty(n_vertices * (n_vertices - 1) // 2)
+
+    for start in range(0, n_vertices, block_rows):
+        stop = min(start + block_rows, n_vertices)
+        block = squared_norms[start:stop, None] + squared_norms[None, :] - 2 * (A[start:stop] @ A).toarray() - 2 * A[start:stop].toarray() ** 2
+        block = np.sqrt(np.maximum(block, 0))
+        for i in range(start, stop):
+            offset = i * (2 * n_vertices - i - 1) // 2
+            distances[offset:offset + n_vertices - i - 1] = block[i - start, i + 1:]
+
+    return distances
+
+def hierarchical_linkage(G):
+    """
+    Single linkage dendrogram of the vertices for the distance of calculate_distance_matrix, 
+    it can be cut at any number of clusters with tau_from_linkage
 
-        new_cluster = clusters[i] + clusters[j]
-        clusters.append(new_cluster)
+    :type G : networkX graph or SparseGraph
+    :rtype : np.array -> the linkage matrix of size (n_vertices - 1, 4) (see scipy.cluster.hierarchy.linkage)
+    """
+    return linkage(calculate_distance_matrix(G), method='single')
 
-        clusters.pop(max(i, j))
-        clusters.pop(min(i, j))
+def tau_from_linkage(Z, n_clusters):
+    """
+    Cut a dendrogram in n_clusters clusters by undoing its last n_clusters - 1 merges
 
-        new_distances = []
-        for k in range(len(distance_matrix)):
-            if k != i and k != j:
-                new_dist = min(distance_matrix[k, i], distance_matrix[k, j])
-                new_distances.append(new_dist)
-        new_distances.append(0.0)  
-
-        distance_matrix = np.delete(distance_matrix, [max(i, j), min(i, j)], axis=0)
-        distance_matrix = np.delete(distance_matrix, [max(i, j), min(i, j)], axis=1)
-        new_distances = np.array(new_distances)
-        distance_matrix = np.vstack((distance_matrix, new_distances[:-1]))
-        distance_matrix = np.column_stack((distance_matrix, new_distances))
-        tau = np.zeros((n_vertices,n_clusters))
-    print('clusters', clusters)
-    for index, sublist in enumerate(clusters):
-        for l in sublist:
-            tau[l, index]=1
+    :type Z : np.array -> the linkage matrix of size (n_vertices - 1, 4)
+    :type n_clusters : int
+    :rtype : np.array -> tau of size (n_vertices, n_clusters), with a one for the cluster to which each node belongs
+    """
+    n_vertices = len(Z) + 1
+    n_merges = n_vertices - n_clusters
+    # The k-th merge creates the node n_vertices + k of the dendrogram, linked to the two nodes it merges
+    children = Z[:n_merges, :2].astype(np.int64).ravel()
+    parents = np.repeat(np.arange(n_vertices, n_vertices + n_merges), 2)
+    tree = coo_array((np.ones(2 * n_merges), (children, parents)), shape=(n_vertices + n_merges, n_vertices + n_merges))
+    _, components = connected_components(tree, directed=False)
+    _, clusters = np.unique(components[:n_vertices], return_inverse=True)
+    tau = np.zeros((n_vertices, n_clusters))
+    tau[np.arange(n_vertices), clusters] = 1
     return tau
 
+def hierarchical_clustering(G, n_clusters):
+    """
+    :type G : networkX graph or SparseGraph
+    :type n_clusters : int
+    :rtype : np.array -> tau of size (n_vertices, n_clusters), with a one for the cluster to which each node belongs
+    """
+    return tau_from_linkage(hierarchical_linkage(G), n_clusters)
+
 def modularity(G, clustering):
     """
     G (graph)
@@ -148,27 +209,110 @@ def best_modularity_change(G, clusters):
 
     
 
-def modularity_clustering(G,n_clusters):
-    n_vertices=G.number_of_nodes()
-    clusters = [[i] for i in range(n_vertices)]
-    delta_q, i, j = best_modularity_change(G, clusters)
-    
-
-    while len(clusters)>n_clusters:
-        new_cluster = clusters[i] + clusters[j]
-        clusters.append(new_cluster)
+def greedy_modularity_merges(A, a, two_m, n_clusters = 1):
+    """
+    Greedy agglomeration of communities maximising the modularity (Clauset, Newman and Moore), merged until n_clusters remain.
+    The modularity changes dq[i][j] = 2 (e_ij - a_i a_j) of the pairs of linked communities are kept in a max heap and only 
+    the pairs of the merged communities are updated. Once no linked pair is left, the two communities with the smallest a are merged.
+
+    :type A : scipy sparse array -> the symmetric weights between the communities, the diagonal is ignored
+    :type a : np.array -> the fraction of the degrees of the graph in each community
+    :type two_m : float -> twice the total weight of the edges of the graph
+    :type n_clusters : int
+    :rtype : list -> the merges (i, j, dq) in order, the community i being merged into j with a change of modularity dq
+    """
+    A = csr_array(A)
+    n_communities = A.shape[0]
+    a = np.array(a, dtype=np.float64)
+
+    dq = [{} for _ in range(n_communities)]
+    rows = np.repeat(np.arange(n_communities), np.diff(A.indptr))
+    for i, j, weight in zip(rows.tolist(), A.indices.tolist(), A.data.tolist()):
+        if i != j:
+            dq[i][j] = 2 * (weight / two_m - a[i] * a[j])
+    heap = [(-value, i, j) for i in range(n_communities) for j, value in dq[i].items() if i < j]
+    heapq.heapify(heap)
+    # communities by increasing a, for the merges of communities that are not linked
+    smallest = [(a[i], i) for i in range(n_communities)]
+    heapq.heapify(smallest)
+
+    alive = np.ones(n_communities, dtype=bool)
+    merges = []
+    while n_communities > n_clusters:
+        # drop the outdated entries of the heaps
+        while heap and not (alive[heap[0][1]] and alive[heap[0][2]] and dq[heap[0][1]].get(heap[0][2]) == -heap[0][0]):
+            heapq.heappop(heap)
+        while not (alive[smallest[0][1]] and a[smallest[0][1]] == smallest[0][0]):
+            heapq.heappop(smallest)
+        first_a, first = heapq.heappop(smallest)
+        while not (alive[smallest[0][1]] and a[smallest[0][1]] == smallest[0][0] and smallest[0][1] != first):
+            heapq.heappop(smallest)
+        second_a, second = smallest[0]
+        heapq.heappush(smallest, (first_a, first))
+
+        if heap and -heap[0][0] >= -2 * first_a * second_a:
+            value, i, j = heapq.heappop(heap)
+            delta_q = -value
+        else:
+            i, j, delta_q = first, second, dq[first].get(second, -2 * first_a * second_a)
+        # merge the community with the fewest neighbours into the other one
+        if len(dq[i]) > len(dq[j]):
+            i, j = j, i
+
+        for k in set(dq[i]) | set(dq[j]):
+            if k == i or k == j:
+                continue
+            if k in dq[i] and k in dq[j]:
+                value = dq[i][k] + dq[j][k]
+            elif k in dq[i]:
+                value = dq[i][k] - 2 * a[j] * a[k]
+            else:
+                value = dq[j][k] - 2 * a[i] * a[k]
+            dq[j][k] = dq[k][j] = value
+            dq[k].pop(i, None)
+            heapq.heappush(heap, (-value, min(j, k), max(j, k)))
+        dq[j].pop(i, None)
+        dq[i] = {}
+        a[j] += a[i]
+        alive[i] = False
+        heapq.heappush(smallest, (a[j], j))
+        merges.append((i, j, delta_q))
+        n_communities -= 1
+    return merges
+
+def tau_from_merges(merges, n_clusters, n_vertices = None):
+    """
+    Partition of the vertices after the first n_vertices - n_clusters merges of a hierarchy. 
+    The merges form a spanning forest, so any n_vertices - n_clusters of them leave exactly n_clusters clusters.
 
-        clusters.pop(max(i, j))
-        clusters.pop(min(i, j))
+    :type merges : np.array -> the merges of size (n_merges, 2), each one given by a vertex of each of the two merged clusters
+    :type n_clusters : int
+    :type n_vertices : int -> defaults to n_merges + 1, for a hierarchy going down to a single cluster
+    :rtype : np.array -> tau of size (n_vertices, n_clusters), with a one for the cluster to which each node belongs
+    """
+    if n_vertices is None:
+        n_vertices = len(merges) + 1
+    merges = np.asarray(merges, dtype=np.int64)[:n_vertices - n_clusters]
+    tree = coo_array((np.ones(len(merges)), (merges[:, 0], merges[:, 1])), shape=(n_vertices, n_vertices))
+    _, clusters = connected_components(tree, directed=False)
+    _, clusters = np.unique(clusters, return_inverse=True)
+    tau = np.zeros((n_vertices, n_clusters))
+    tau[np.arange(n_vertices), clusters] = 1
+    return tau
 
-        delta_q, i, j = best_modularity_change(G, clusters)
- 
+def modularity_clustering(G,n_clusters):
+    """
+    Greedy agglomeration of the vertices maximising the modularity (see greedy_modularity_merges), merged until n_clusters remain
 
-    tau = np.zeros((n_vertices,len(clusters)))
-    for index, sublist in enumerate(clusters):
-        for l in sublist:
-            tau[l, index]=1
-    return tau
+    :type G : networkX graph or SparseGraph
+    :type n_clusters : int
+    :rtype : np.array -> tau of size (n_vertices, n_clusters), with a one for the cluster to which each node belongs
+    """
+    A = get_sparse_graph(G).to_scipy()
+    two_m = A.sum()
+    a = np.asarray(A.sum(axis=1)).ravel() / two_m if two_m > 0 else np.zeros(A.shape[0])
+    merges = [(i, j) for i, j, _ in greedy_modularity_merges(A, a, two_m, n_clusters)]
+    return tau_from_merges(np.array(merges).reshape(-1, 2), n_clusters, A.shape[0])
 
 def modularity_clustering_optim(G,n_clusters):
     n_vertices=G.number_of_nodes()
@@ -192,18 +336,62 @@ def modularity_clustering_optim(G,n_clusters):
             tau[l, index]=1
     return tau
 
-def modularity_module(graph, n_classes):    
-    communities = list(nx_community.louvain_communities(graph))
-    
-    n_nodes = graph.number_of_nodes()
-    tau = np.zeros((n_nodes, n_classes))
-
-    for comm_index, community in enumerate(communities):
-        if comm_index < n_classes:
-            for node in community:
-                tau[node, comm_index] = 1
-
-    return tau
+def louvain_hierarchy(G, seed = None):
+    """
+    Hierarchy of merges of the vertices going through every level of the Louvain method, that can be cut at any number of clusters 
+    with tau_from_merges. Between two levels (starting from the singletons and ending with a single cluster), the communities of 
+    the finer level inside each community of the coarser level are agglomerated with greedy_modularity_merges, and the merges of 
+    the level are ordered by decreasing modularity gain. Cutting between two levels thus splits the communities of the coarser level 
+    where it costs the least modularity.
+
+    :type G : networkX graph or SparseGraph
+    :type seed : int -> the seed of louvain_partitions
+    :rtype : np.array -> the merges of size (n_vertices - 1, 2), each one given by a vertex of each of the two merged clusters
+    """
+    graph = get_sparse_graph(G)
+    n_vertices = graph.number_of_nodes()
+    A = graph.to_scipy()
+    two_m = A.sum()
+    a = np.asarray(A.sum(axis=1)).ravel() / two_m if two_m > 0 else np.zeros(n_vertices)
+
+    nx_graph = graph.to_networkx()
+    node_index = {node: index for index, node in enumerate(nx_graph.nodes())}
+    levels = [np.arange(n_vertices)]
+    for partition in nx_community.louvain_partitions(nx_graph, seed=seed):
+        labels = np.zeros(n_vertices, dtype=np.int64)
+        for comm_index, community in enumerate(partition):
+            labels[[node_index[node] for node in community]] = comm_index
+        levels.append(labels)
+    levels.append(np.zeros(n_vertices, dtype=np.int64))
+
+    merges = []
+    for fine, coarse in zip(levels[:-1], levels[1:]):
+        n_fine = fine.max() + 1 if n_vertices > 0 else 0
+        # weights between the communities of the fine level, their a, a vertex of each and the coarse community containing each
+        P = csr_array((np.ones(n_vertices), (np.arange(n_vertices), fine)), shape=(n_vertices, n_fine))
+        A_fine = csr_array(P.T @ A @ P)
+        a_fine = np.bincount(fine, weights=a, minlength=n_fine)
+        representative = np.zeros(n_fine, dtype=np.int64)
+        representative[fine[::-1]] = np.arange(n_vertices)[::-1]
+        parent = np.zeros(n_fine, dtype=np.int64)
+        parent[fine] = coarse
+
+        level_merges = []
+        for members in np.split(np.argsort(parent, kind='stable'), np.cumsum(np.bincount(parent))[:-1]):
+            if len(members) < 2:
+                continue
+            for i, j, delta_q in greedy_modularity_merges(A_fine[members][:, members], a_fine[members], two_m):
+                level_merges.append((-delta_q, len(level_merges), representative[members[i]], representative[members[j]]))
+        merges += [(u, v) for _, _, u, v in sorted(level_merges)]
+    return np.array(merges, dtype=np.int64).reshape(-1, 2)
+
+def modularity_module(graph, n_classes):
+    """
+    :type graph : networkX graph or SparseGraph
+    :type n_classes : int
+    :rtype : np.array -> tau of size (n_vertices, n_classes), from the Louvain hierarchy (see louvain_hierarchy)
+    """
+    return tau_from_merges(louvain_hierarchy(graph), n_classes)
 
 def best_modularity_change_optim(G, clusters):
     deltas_q={}
@@ -213,8 +401,131 @@ def best_modularity_change_optim(G, clusters):
         sub_graph2=G.subgraph(clusters[j])
         sub_graph_union=G.subgraph(clusters[i] + clusters[j])
 
-        delta_q=(sub_graph_union.number_of_edges()/m)-((sub_graph1.number_of_edges()/m) + (sub_graph2.number_of_edges()/m)) 
-        + (sub_graph2.number_of_nodes()*sub_graph1.number_of_nodes())/m
+        # edges between the two clusters / m - 2 (degree sum 1 / 2m) (degree sum 2 / 2m), the change of modularity(G, clusters)
+        delta_q=((sub_graph_union.number_of_edges() - sub_graph1.number_of_edges() - sub_graph2.number_of_edges())/m
+                 - (sum(deg for _, deg in G.degree(clusters[i])) * sum(deg for _, deg in G.degree(clusters[j])))/(2*m**2))
         deltas_q[(i,j)]=delta_q
     max_value, i, j = max(deltas_q.values()), max(deltas_q, key=lambda k: deltas_q[k])[0], max(deltas_q, key=lambda k: deltas_q[k])[1]
-    return max_value, i, j
\ No newline at end of file
+    return max_value, i, j
+
+
+def initialisation_precomputed(G, n_clusters, method, **params):
+    """
+    The expensive part of an initialisation method, shared by all its numbers of clusters: the eigenvectors of spectral_embedding 
+    for 'spectral' (for n_clusters clusters), the dendrogram of hierarchical_linkage for 'hierarchical' and the communities of 
+    louvain_hierarchy for 'modularity'. params are given to these functions.
+
+    :type G : networkX graph or SparseGraph
+    :type n_clusters : int
+    :type method : str
+    :rtype : np.array, or None for the other methods
+    """
+    if method == 'spectral':
+        return spectral_embedding(G, n_clusters, **params)
+    if method == 'hierarchical':
+        return hierarchical_linkage(G, **params)
+    if method == 'modularity':
+        return louvain_hierarchy(G, **params)
+    return None
+
+# The methods whose initialisation does not depend on any random state, all their restarts would be the same fit
+DETERMINISTIC_METHODS = ('hierarchical',)
+
+def restart_params(method, restart):
+    """
+    The params of initialisation_precomputed that make the restarts of a method differ: the seed of louvain_partitions
+    for 'modularity', so that every restart gets its own Louvain hierarchy (the spectral restarts already differ by their k-means).
+
+    :type method : str
+    :type restart : int or None -> None for a single fit
+    :rtype : dict
+    """
+    if method == 'modularity' and restart is not None:
+        return {'seed' : restart}
+    return {}
+
+def tau_from_precomputed(precomputed, n_clusters, method):
+    """
+    The cheap part of an initialisation method, tau of size (n_vertices, n_clusters) from initialisation_precomputed
+
+    :type precomputed : np.array
+    :type n_clusters : int
+    :type method : str -> 'spectral', 'hierarchical' or 'modularity'
+    :rtype : np.array
+    """
+    if method == 'spectral':
+        return tau_from_embedding(precomputed, n_clusters)
+    if method == 'hierarchical':
+        return tau_from_linkage(precomputed, n_clusters)
+    if method == 'modularity':
+        return tau_from_merges(precomputed, n_clusters)
+    raise ValueError(f"No precomputed initialisation for the method {method}")
+
+class InitialisationCache():
+    def __init__(self, max_entries = 8, max_bytes = None, path = None):
+        """Least recently used cache of initialisation_precomputed, keyed by the fingerprint of the adjacency 
+        (see SparseGraph.fingerprint), the method and its parameters
+
+        Args:
+            max_entries (int, optional): the number of entries kept in memory. Defaults to 8.
+            max_bytes (int, optional): bound on the total size of the entries kept in memory. Defaults to None.
+            path (str, optional): a folder where every entry is also saved as a npy file, and looked for on a miss. Defaults to None.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def nbytes(self):
+        return sum(value.nbytes for value in self.entries.values())
+
+    def file_name(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
+
+    def get(self, key):
+        """The entry of key (None if it is unknown), which becomes the most recently used"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.path is not None and os.path.exists(self.file_name(key)):
+            value = np.load(self.file_name(key))
+            self.put(key, value, save = False)
+            return value
+        return None
+
+    def put(self, key, value, save = True):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if save and self.path is not None:
+            np.save(self.file_name(key), value)
+        while len(self.entries) > self.max_entries or (self.max_bytes is not None and len(self.entries) > 1 and self.nbytes() > self.max_bytes):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Empty the memory, the files of path are kept"""
+        self.entries.clear()
+
+    def precomputed(self, G, n_clusters, method, **params):
+        """initialisation_precomputed(G, n_clusters, method, **params), computed only if it is not in the cache.
+        The spectral eigenvectors are stored once per graph, for the largest number of clusters asked so far.
+
+        :rtype : np.array, or None if the method has nothing to precompute
+        """
+        if method not in ('spectral', 'hierarchical', 'modularity'):
+            return None
+        key = (get_sparse_graph(G).fingerprint(), method, tuple(sorted(params.items())))
+        value = self.get(key)
+        if value is None or (method == 'spectral' and value.shape[1] < min(n_clusters, len(value))):
+            self.misses += 1
+            value = initialisation_precomputed(G, n_clusters, method, **params)
+            self.put(key, value)
+        else:
+            self.hits += 1
+        return value
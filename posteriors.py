@@ -0,0 +1,83 @@
+import numpy as np
+
+def index_dtype(n_max):
+    """The smallest of int16, int32 and int64 holding the values 0, ..., n_max - 1"""
+    for dtype in (np.int16, np.int32):
+        if n_max <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class CompactTau():
+    def __init__(self, labels, rows, clusters, probs, n_clusters, threshold = 0):
+        """Posterior memberships tau of size (n_vertices, n_clusters) stored as the label (argmax) of every vertex,
+        plus the (row, cluster, prob) triplets of the rows that are not one-hot. Build it with from_dense.
+
+        Args:
+            labels (np.array): argmax of every row of tau, of size n_vertices
+            rows, clusters, probs (np.array): the entries of tau above threshold in the rows that are not one-hot
+            n_clusters (int): the number of clusters
+            threshold (float, optional): the largest entry that was dropped. Defaults to 0.
+        """
+        self.labels = labels
+        self.rows = rows
+        self.clusters = clusters
+        self.probs = probs
+        self.n_clusters = n_clusters
+        self.threshold = threshold
+
+    @classmethod
+    def from_dense(cls, tau, threshold = 1e-12):
+        """Compact tau. A row whose label has a probability of at least 1 - threshold is stored as its label only,
+        and in the other rows only the probabilities above threshold are kept, so every entry of to_dense() is within
+        n_clusters * threshold of tau (threshold = 0 only compacts the exactly one-hot rows, and to_dense() gives tau back)
+
+        Args:
+            tau (np.array or torch tensor): tau of size (n_vertices, n_clusters)
+            threshold (float, optional): Defaults to 1e-12.
+        """
+        tau = np.asarray(tau.to('cpu') if hasattr(tau, 'to') else tau)
+        n_vertices, n_clusters = tau.shape
+        labels = np.argmax(tau, axis=1)
+        uncertain = np.nonzero(tau[np.arange(n_vertices), labels] < 1 - threshold)[0]
+        rows, clusters = np.nonzero(tau[uncertain] > threshold)
+        probs = tau[uncertain[rows], clusters]
+        return cls(labels.astype(index_dtype(n_clusters)), uncertain[rows].astype(index_dtype(n_vertices)), clusters.astype(index_dtype(n_clusters)),
+                   probs, n_clusters, threshold)
+
+    @property
+    def shape(self):
+        return (len(self.labels), self.n_clusters)
+
+    @property
+    def nbytes(self):
+        return self.labels.nbytes + self.rows.nbytes + self.clusters.nbytes + self.probs.nbytes
+
+    def to_dense(self):
+        """tau as a np.array of size (n_vertices, n_clusters)"""
+        tau = np.zeros(self.shape)
+        tau[np.arange(len(self.labels)), self.labels] = 1
+        uncertain = np.unique(self.rows)
+        tau[uncertain] = 0
+        tau[self.rows, self.clusters] = self.probs
+        return tau
+
+    def __array__(self, dtype = None, copy = None):
+        tau = self.to_dense()
+        return tau if dtype is None else tau.astype(dtype)
+
+    def save(self, path):
+        """Write the arrays in a npz file"""
+        np.savez(path, labels=self.labels, rows=self.rows, clusters=self.clusters, probs=self.probs,
+                 n_clusters=self.n_clusters, threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['labels'], arrays['rows'], arrays['clusters'], arrays['probs'], int(arrays['n_clusters']), float(arrays['threshold']))
+
+def tau_labels(tau):
+    """The label (argmax) of every vertex, from a dense tau (np.array or torch tensor) or a CompactTau"""
+    if isinstance(tau, CompactTau):
+        return tau.labels.astype(np.int64)
+    tau = np.asarray(tau.to('cpu') if hasattr(tau, 'to') else tau)
+    return np.argmax(tau, axis=1)
@@ -0,0 +1,201 @@
+import numpy as np
+import json
+import os
+import uuid
+
+from collections.abc import Mapping
+
+from posteriors import CompactTau
+
+def to_json(value):
+    """The numpy scalars and arrays of a results entry as python values, for json.dumps"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class StoredResult(Mapping):
+    def __init__(self, folder, record):
+        """A results entry of a ResultsStore. The scalars are read from the index,
+        the arrays ('tau', 'pi', 'priors', ...) are only memory mapped (copy on write) when they are accessed,
+        and a CompactTau is only read when it is accessed
+
+        Args:
+            folder (str): the folder of the store
+            record (dict): the line of the entry in the index
+        """
+        self.folder = folder
+        self.record = record
+
+    def __getitem__(self, key):
+        if key in self.record['arrays']:
+            return np.load(os.path.join(self.folder, self.record['arrays'][key]), mmap_mode='c')
+        if key in self.record.get('compact', {}):
+            return CompactTau.load(os.path.join(self.folder, self.record['compact'][key]))
+        return self.record['scalars'][key]
+
+    def __iter__(self):
+        yield from self.record['scalars']
+        yield from self.record['arrays']
+        yield from self.record.get('compact', {})
+
+    def __len__(self):
+        return len(self.record['scalars']) + len(self.record['arrays']) + len(self.record.get('compact', {}))
+
+    def load(self):
+        """The entry as a dict, with its arrays read in memory (a CompactTau stays compact)"""
+        return {key : np.array(value) if key in self.record['arrays'] else value for key, value in self.items()}
+
+class ResultsStore():
+    INDEX = 'index.jsonl'
+
+    def __init__(self, path):
+        """Folder of fits written one at a time: the arrays of each fit in npy files,
+        and everything else (ICL, iterations, timings, traces) as one line of the JSONL index.
+        An entry is only listed in the index once its arrays are on disk, so a crash loses at most the fit in progress.
+
+        Args:
+            path (str): the folder, created if needed. Appending to an existing store keeps its entries.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, result, **keys):
+        """Write a results entry (see run_EM) at the end of the store
+
+        Args:
+            result (dict): the entry, its numpy arrays are saved as npy files and its CompactTau as npz files
+            **keys: more scalars to store with it, e.g. the restart number
+
+        Returns:
+            str: the id of the entry
+        """
+        entry_id = uuid.uuid4().hex[:12]
+        record = {'id' : entry_id, 'scalars' : {}, 'arrays' : {}, 'compact' : {}}
+        for key, value in result.items():
+            if isinstance(value, CompactTau):
+                file_name = f'{entry_id}_{key}.npz'
+                value.save(os.path.join(self.path, file_name + '.tmp.npz'))
+                os.replace(os.path.join(self.path, file_name + '.tmp.npz'), os.path.join(self.path, file_name))
+                record['compact'][key] = file_name
+            elif isinstance(value, np.ndarray):
+                file_name = f'{entry_id}_{key}.npy'
+                np.save(os.path.join(self.path, file_name + '.tmp.npy'), value)
+                os.replace(os.path.join(self.path, file_name + '.tmp.npy'), os.path.join(self.path, file_name))
+                record['arrays'][key] = file_name
+            else:
+                record['scalars'][key] = value
+        record['scalars'].update(keys)
+        index_path = os.path.join(self.path, self.INDEX)
+        # a line cut by a crash is ended first, so that it does not swallow the new one
+        cut_line = False
+        if os.path.exists(index_path) and os.path.getsize(index_path) > 0:
+            with open(index_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                cut_line = f.read(1) != b'\n'
+        with open(index_path, 'a') as f:
+            f.write(('\n' if cut_line else '') + json.dumps(record, default=to_json) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return entry_id
+
+    def records(self):
+        """The lines of the index, in the order of the fits. A line cut by a crash is skipped"""
+        records = []
+        index_path = os.path.join(self.path, self.INDEX)
+        if not os.path.exists(index_path):
+            return records
+        with open(index_path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def index(self):
+        """The scalars of every entry (ICL, n_clusters, initialisation, n_iter, ...) with its 'id', without reading any array"""
+        return [dict(record['scalars'], id=record['id']) for record in self.records()]
+
+    def entries(self):
+        """Every entry as a StoredResult, in the order of the fits"""
+        return [StoredResult(self.path, record) for record in self.records()]
+
+    def latest(self):
+        """The last entry of every number of clusters, as StoredResult
+
+        Returns:
+            dict: n_clusters -> StoredResult
+        """
+        return {entry['n_clusters'] : entry for entry in self.entries()}
+
+    def __len__(self):
+        return len(self.records())
+
+class Checkpoint():
+    STATE = 'state.json'
+
+    def __init__(self, path, interval = 1):
+        """Progress of a campaign of fits, made of jobs (method, n_clusters, restart), kept in a ResultsStore so that 
+        a rerun of the same campaign skips the finished jobs. The results of the jobs are written every interval jobs, 
+        together with the state of the random generators given to add (restored by the rerun with rng_state).
+
+        Args:
+            path (str): the folder of the checkpoint, created if needed
+            interval (int, optional): the number of finished jobs between two writes. Defaults to 1.
+        """
+        self.store = ResultsStore(path)
+        self.interval = interval
+        self.pending = []
+        self.done = {entry['job'] : entry for entry in self.store.entries() if 'job' in entry}
+        self.rng_state = None
+        self.last_rng_state = None
+        state_path = os.path.join(path, self.STATE)
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.rng_state = json.load(f).get('rng_state')
+
+    @staticmethod
+    def key(job):
+        """'method/n_clusters' or 'method/n_clusters/restart' for a job (method, n_clusters, restart), restart being None for the batched restarts"""
+        method, n_clusters, restart = job
+        return f'{method}/{n_clusters}' if restart is None else f'{method}/{n_clusters}/{restart}'
+
+    def __contains__(self, job):
+        return self.key(job) in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def get(self, job):
+        """The results entry of a finished job (a StoredResult once written)"""
+        return self.done[self.key(job)]
+
+    def add(self, job, result, rng_state = None):
+        """Mark job as finished with its results entry, and write the pending jobs if there are interval of them
+
+        Args:
+            job (tuple): (method, n_clusters, restart)
+            result (dict): the results entry of the job
+            rng_state (optional): the state of the random generators after the job, saved as JSON. Defaults to None.
+        """
+        self.done[self.key(job)] = result
+        self.pending.append(job)
+        self.last_rng_state = rng_state
+        if len(self.pending) >= self.interval:
+            self.save()
+
+    def save(self):
+        """Write the pending jobs, then the state of the random generators after the last of them"""
+        if len(self.pending) == 0:
+            return
+        for job in self.pending:
+            key = self.key(job)
+            self.store.append(self.done[key], job=key)
+        state_path = os.path.join(self.store.path, self.STATE)
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump({'rng_state' : self.last_rng_state, 'n_done' : len(self.done)}, f, default=to_json)
+        os.replace(state_path + '.tmp', state_path)
+        self.rng_state = self.last_rng_state
+        self.pending = []
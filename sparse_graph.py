@@ -0,0 +1,177 @@
+import numpy as np
+import hashlib
+import json
+import os
+import networkx as nx
+import torch
+
+from scipy.sparse import coo_array, csr_array
+
+class SparseGraph():
+    def __init__(self, indptr, indices, data = None, n_nodes = None, node_labels = None):
+        """Undirected graph stored as the CSR arrays of its symmetric adjacency, without self loops
+
+        Args:
+            indptr (np.array): CSR row pointers, of size (n_vertices + 1)
+            indices (np.array): CSR column indices, sorted within each row
+            data (np.array, optional): the weights of the edges. Defaults to ones.
+            n_nodes (int, optional): the number of vertices. Defaults to len(indptr) - 1.
+            node_labels (list, optional): the label of each vertex, e.g. the nodes of the networkx graph. Defaults to None.
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.data = np.ones(len(indices)) if data is None else data
+        self.n_nodes = len(indptr) - 1 if n_nodes is None else n_nodes
+        self.node_labels = node_labels
+        self._torch_cache = {}
+        self._networkx = None
+        self._fingerprint = None
+
+    @classmethod
+    def from_scipy(cls, adjacency, node_labels = None):
+        """Build the graph from a symmetric scipy sparse adjacency, the diagonal is dropped"""
+        adjacency = coo_array(adjacency)
+        off_diagonal = adjacency.row != adjacency.col
+        adjacency = csr_array((adjacency.data[off_diagonal], (adjacency.row[off_diagonal], adjacency.col[off_diagonal])), shape=adjacency.shape)
+        adjacency.sum_duplicates()
+        adjacency.sort_indices()
+        return cls(adjacency.indptr, adjacency.indices, adjacency.data, adjacency.shape[0], node_labels)
+
+    @classmethod
+    def from_networkx(cls, graph, weight = 'weight'):
+        """Build the graph from a networkx graph, the vertex i is the i-th node of graph.nodes()"""
+        adjacency = nx.to_scipy_sparse_array(graph, weight=weight, format='csr')
+        return cls.from_scipy(adjacency, node_labels=list(graph.nodes()))
+
+    @classmethod
+    def from_edge_list(cls, edges, n_nodes = None, weights = None, node_labels = None):
+        """Build the graph from an array of size (n_edges, 2) where each undirected edge is listed once
+
+        Args:
+            edges (np.array): the edges, as pairs of vertex indices
+            n_nodes (int, optional): the number of vertices. Defaults to the largest index + 1.
+            weights (np.array, optional): the weight of each edge. Defaults to ones.
+            node_labels (list, optional): the label of each vertex. Defaults to None.
+        """
+        edges = np.asarray(edges)
+        if n_nodes is None:
+            n_nodes = int(edges.max()) + 1 if len(edges) > 0 else 0
+        if weights is None:
+            weights = np.ones(len(edges))
+        rows = np.concatenate((edges[:, 0], edges[:, 1]))
+        cols = np.concatenate((edges[:, 1], edges[:, 0]))
+        adjacency = coo_array((np.concatenate((weights, weights)), (rows, cols)), shape=(n_nodes, n_nodes))
+        return cls.from_scipy(adjacency, node_labels)
+
+    @classmethod
+    def from_edge_shards(cls, shards, n_nodes, node_labels = None):
+        """Build the graph from npy files of edges of size (n_edges, 2), each undirected edge listed once in one of them.
+        The CSR arrays are filled shard by shard (memory mapped), without the symmetric list of edges ever being built.
+
+        Args:
+            shards (list): the paths of the npy files
+            n_nodes (int): the number of vertices
+            node_labels (list, optional): the label of each vertex. Defaults to None.
+        """
+        degrees = np.zeros(n_nodes, dtype=np.int64)
+        for shard in shards:
+            edges = np.load(shard, mmap_mode='r')
+            edges = edges[edges[:, 0] != edges[:, 1]]
+            degrees += np.bincount(edges[:, 0], minlength=n_nodes) + np.bincount(edges[:, 1], minlength=n_nodes)
+        index_dtype = np.int32 if max(n_nodes, degrees.sum()) < 2**31 else np.int64
+        indptr = np.concatenate(([0], np.cumsum(degrees))).astype(index_dtype)
+        indices = np.empty(indptr[-1], dtype=index_dtype)
+
+        next_position = indptr[:-1].copy()
+        for shard in shards:
+            edges = np.load(shard, mmap_mode='r')
+            edges = edges[edges[:, 0] != edges[:, 1]]
+            sources = np.concatenate((edges[:, 0], edges[:, 1]))
+            targets = np.concatenate((edges[:, 1], edges[:, 0]))
+            order = np.argsort(sources, kind='stable')
+            sources, targets = sources[order], targets[order]
+            rank = np.arange(len(sources)) - np.searchsorted(sources, sources)
+            indices[next_position[sources] + rank] = targets
+            next_position += np.bincount(sources, minlength=n_nodes)
+
+        adjacency = csr_array((np.ones(len(indices)), indices, indptr), shape=(n_nodes, n_nodes))
+        adjacency.sort_indices()
+        return cls(adjacency.indptr, adjacency.indices, adjacency.data, n_nodes, node_labels)
+
+    @classmethod
+    def load(cls, path):
+        """Read a folder of edge shards described by a meta.json holding 'n_nodes' and the file names of the 'shards' (see generator.write_sbm)"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls.from_edge_shards([os.path.join(path, shard) for shard in meta['shards']], meta['n_nodes'])
+
+    @property
+    def shape(self):
+        return (self.n_nodes, self.n_nodes)
+
+    def number_of_nodes(self):
+        return self.n_nodes
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def degrees(self):
+        """The number of neighbours of each vertex"""
+        return np.diff(self.indptr)
+
+    def rows(self, nodes):
+        """The edges leaving some vertices, read from the CSR arrays in O(len(nodes) + their degrees)
+
+        Args:
+            nodes (np.array): indices of the vertices
+
+        Returns:
+            positions, cols, values: for each edge, the position of its source in nodes, its target and its weight
+        """
+        starts = self.indptr[nodes]
+        counts = self.indptr[nodes + 1] - starts
+        positions = np.repeat(np.arange(len(nodes)), counts)
+        edge_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        return positions, self.indices[edge_index], self.data[edge_index]
+
+    def fingerprint(self):
+        """Hex digest of the adjacency (number of vertices and CSR arrays, whatever their dtypes), computed once"""
+        if self._fingerprint is None:
+            digest = hashlib.sha1(np.int64(self.n_nodes).tobytes())
+            for array, dtype in ((self.indptr, np.int64), (self.indices, np.int64), (self.data, np.float64)):
+                digest.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def to_scipy(self):
+        """The adjacency as a scipy csr_array, sharing the arrays of the graph"""
+        return csr_array((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def to_torch(self, device = None, dtype = torch.float64):
+        """The adjacency as a coalesced torch sparse tensor, built once per device and dtype
+
+        Args:
+            device (torch.device, optional): Defaults to cuda if it is available, else cpu.
+            dtype (torch.dtype, optional): Defaults to torch.float64.
+        """
+        if device is None:
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        key = (str(device), dtype)
+        if key not in self._torch_cache:
+            rows = torch.from_numpy(np.repeat(np.arange(self.n_nodes), self.degrees()))
+            cols = torch.from_numpy(self.indices.astype(np.int64))
+            values = torch.from_numpy(np.asarray(self.data)).to(dtype)
+            X = torch.sparse_coo_tensor(torch.stack((rows, cols)), values, self.shape, check_invariants=False)
+            self._torch_cache[key] = X.coalesce().to(device)
+        return self._torch_cache[key]
+
+    def to_networkx(self):
+        """The graph as a networkx graph with the nodes 0, ..., n_vertices - 1, built once"""
+        if self._networkx is None:
+            self._networkx = nx.from_scipy_sparse_array(self.to_scipy())
+        return self._networkx
+
+    def node_index(self):
+        """Dictionary from the label of each vertex to its index"""
+        labels = range(self.n_nodes) if self.node_labels is None else self.node_labels
+        return {label: index for index, label in enumerate(labels)}
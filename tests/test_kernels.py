@@ -0,0 +1,127 @@
+"""Seeded equivalence checks of the kernels of EM_torch.py against the dense ones"""
+import pytest
+
+torch = pytest.importorskip('torch')
+import numpy as np
+from scipy.sparse import csr_array
+
+import EM_torch
+
+N_NODES = 12
+N_CLUSTERS = 3
+TILE_ROWS = 5
+
+def assert_close(actual, expected):
+    torch.testing.assert_close(torch.as_tensor(actual), torch.as_tensor(expected), rtol=1e-7, atol=1e-9)
+
+@pytest.fixture
+def case():
+    """A small SBM graph with a random tau, as a dense tensor for the dense kernels and a sparse tensor for the others"""
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, N_CLUSTERS, size=N_NODES)
+    probabilities = np.full((N_CLUSTERS, N_CLUSTERS), 0.15) + 0.6 * np.eye(N_CLUSTERS)
+    adjacency = np.triu(rng.random((N_NODES, N_NODES)) < probabilities[labels][:, labels], 1).astype(np.float64)
+    adjacency = adjacency + adjacency.T
+    tau = torch.from_numpy(rng.dirichlet(np.ones(N_CLUSTERS), size=N_NODES))
+    dense_edges = torch.from_numpy(adjacency)
+    sparse_edges = EM_torch.get_sparse_X(csr_array(adjacency), dtype=tau.dtype)
+    priors, pi = EM_torch.return_priors_pi(dense_edges, tau)
+    return dense_edges, sparse_edges, tau, priors, pi
+
+def entropy(tau):
+    return - torch.sum(tau * EM_torch.safe_log(tau)).item()
+
+def test_get_sparse_X_small_dense_adjacency():
+    for adjacency in (np.array([[0, 1], [1, 0]]), np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]])):
+        X = EM_torch.get_sparse_X(adjacency, n_nodes=len(adjacency))
+        assert_close(X.to_dense(), torch.from_numpy(adjacency).double())
+
+def test_get_sparse_X_edge_list():
+    X = EM_torch.get_sparse_X(np.array([[0, 1], [1, 2]]), n_nodes=3, format='edges')
+    assert_close(X.to_dense(), torch.tensor([[0., 1., 0.], [1., 0., 1.], [0., 1., 0.]], dtype=torch.float64))
+    with pytest.raises(ValueError):
+        EM_torch.get_sparse_X(np.array([[0, 1], [1, 2], [2, 3]]))
+
+def test_priors_pi_sparse_matches_dense(case):
+    dense_edges, sparse_edges, tau, priors, pi = case
+    sparse_priors, sparse_pi = EM_torch.return_priors_pi_sparse(sparse_edges, tau, include_self_pairs=True)
+    assert_close(sparse_priors, priors)
+    assert_close(sparse_pi, pi)
+
+def test_priors_pi_sparse_counts_pairs_i_neq_j(case):
+    dense_edges, sparse_edges, tau, _, _ = case
+    theta = tau[:, None, :, None] * tau[None, :, None, :]
+    off_diagonal = 1 - torch.eye(N_NODES, dtype=tau.dtype)[:, :, None, None]
+    expected_pi = torch.sum(theta * dense_edges[:, :, None, None], dim=(0, 1)) / torch.sum(theta * off_diagonal, dim=(0, 1))
+    _, sparse_pi = EM_torch.return_priors_pi_sparse(sparse_edges, tau)
+    assert_close(sparse_pi, expected_pi)
+
+def test_appro_tau_sparse_matches_dense(case):
+    dense_edges, sparse_edges, tau, priors, pi = case
+    # eps = 0 runs all the iterations in both
+    expected = EM_torch.appro_tau(tau, dense_edges, pi, priors, eps=0, max_iter=5)
+    assert_close(EM_torch.appro_tau_sparse(tau, sparse_edges, pi, priors, eps=0, max_iter=5), expected)
+
+def test_J_R_x_sparse_matches_dense(case):
+    dense_edges, sparse_edges, tau, priors, pi = case
+    # J_R_x adds sum tau log tau where J_R_x_sparse adds the entropy
+    expected = EM_torch.J_R_x(dense_edges, tau, pi, priors) + 2 * entropy(tau)
+    assert EM_torch.J_R_x_sparse(sparse_edges, tau, pi, priors) == pytest.approx(expected, rel=1e-9)
+
+def test_ICL_sparse_matches_dense(case):
+    dense_edges, sparse_edges, tau, priors, pi = case
+    expected = EM_torch.ICL(dense_edges, tau, pi, priors)
+    assert EM_torch.ICL_sparse(sparse_edges, tau, pi, priors) == pytest.approx(expected, rel=1e-9)
+
+def test_batched_kernels_match_sparse(case):
+    _, sparse_edges, tau, _, _ = case
+    taus = torch.stack((tau, tau.flip(1)))
+    batched_priors, batched_pi = EM_torch.return_priors_pi_batched(sparse_edges, taus)
+    batched_tau = EM_torch.appro_tau_batched(taus, sparse_edges, batched_pi, batched_priors, eps=0, max_iter=5)
+    for r in range(len(taus)):
+        priors, pi = EM_torch.return_priors_pi_sparse(sparse_edges, taus[r])
+        assert_close(batched_priors[r], priors)
+        assert_close(batched_pi[r], pi)
+        assert_close(batched_tau[r], EM_torch.appro_tau_sparse(taus[r], sparse_edges, pi, priors, eps=0, max_iter=5))
+
+def test_tiled_kernels_match_dense(case):
+    dense_edges, sparse_edges, tau, priors, pi = case
+    tiled_priors, tiled_pi = EM_torch.return_priors_pi_tiled(dense_edges, tau, TILE_ROWS, include_self_pairs=True)
+    assert_close(tiled_priors, priors)
+    assert_close(tiled_pi, pi)
+    assert_close(EM_torch.appro_tau_tiled(tau, dense_edges, pi, priors, TILE_ROWS, eps=0, max_iter=5),
+                 EM_torch.appro_tau(tau, dense_edges, pi, priors, eps=0, max_iter=5))
+    assert EM_torch.J_R_x_tiled(dense_edges, tau, pi, priors, TILE_ROWS, entropy_sign=1) == pytest.approx(EM_torch.J_R_x(dense_edges, tau, pi, priors), rel=1e-9)
+
+def test_tiled_kernels_match_sparse(case):
+    dense_edges, sparse_edges, tau, _, _ = case
+    priors, pi = EM_torch.return_priors_pi_sparse(sparse_edges, tau)
+    tiled_priors, tiled_pi = EM_torch.return_priors_pi_tiled(dense_edges, tau, TILE_ROWS)
+    assert_close(tiled_priors, priors)
+    assert_close(tiled_pi, pi)
+    assert EM_torch.J_R_x_tiled(dense_edges, tau, pi, priors, TILE_ROWS) == pytest.approx(EM_torch.J_R_x_sparse(sparse_edges, tau, pi, priors), rel=1e-9)
+
+def test_topk_kernels_match_sparse_when_k_is_n_clusters(case):
+    _, sparse_edges, tau, _, _ = case
+    indices, values = EM_torch.topk_tau(tau, N_CLUSTERS)
+    assert_close(EM_torch.topk_to_dense(indices, values, N_CLUSTERS), tau)
+
+    priors, pi = EM_torch.return_priors_pi_sparse(sparse_edges, tau)
+    topk_priors, topk_pi = EM_torch.return_priors_pi_topk(sparse_edges, indices, values, N_CLUSTERS)
+    assert_close(topk_priors, priors)
+    assert_close(topk_pi, pi)
+    assert EM_torch.J_R_x_topk(sparse_edges, indices, values, pi, priors) == pytest.approx(EM_torch.J_R_x_sparse(sparse_edges, tau, pi, priors), rel=1e-9)
+
+    new_indices, new_values = EM_torch.appro_tau_topk(indices, values, sparse_edges, pi, priors, eps=0, max_iter=5)
+    assert_close(EM_torch.topk_to_dense(new_indices, new_values, N_CLUSTERS), EM_torch.appro_tau_sparse(tau, sparse_edges, pi, priors, eps=0, max_iter=5))
+
+def test_topk_kernels_do_not_depend_on_the_edge_chunks(case):
+    _, sparse_edges, tau, _, _ = case
+    indices, values = EM_torch.topk_tau(tau, 2)
+    priors, pi = EM_torch.return_priors_pi_topk(sparse_edges, indices, values, N_CLUSTERS)
+    for expected, actual in zip(EM_torch.topk_block_masses(sparse_edges, indices, values, N_CLUSTERS),
+                                EM_torch.topk_block_masses(sparse_edges, indices, values, N_CLUSTERS, chunk_edges=7)):
+        assert_close(actual, expected)
+    expected_indices, expected_values = EM_torch.appro_tau_topk(indices, values, sparse_edges, pi, priors, eps=0, max_iter=5)
+    chunked_indices, chunked_values = EM_torch.appro_tau_topk(indices, values, sparse_edges, pi, priors, eps=0, max_iter=5, chunk_edges=7)
+    assert_close(EM_torch.topk_to_dense(chunked_indices, chunked_values, N_CLUSTERS), EM_torch.topk_to_dense(expected_indices, expected_values, N_CLUSTERS))